@@ -0,0 +1,4 @@
+from parse_uspto_xml.cli import main
+
+
+main()
@@ -0,0 +1,359 @@
+"""
+Compact citation graph built from the parsed `referential_documents`.
+
+Document numbers are interned to integer ids and the edges are stored as
+CSR (compressed sparse row) adjacency arrays in both directions, so a
+patent's citations and the patents citing it are contiguous slices. The
+graph is saved to a single file which is memory-mapped when loaded, so
+queries do not need to read (or unpickle) the whole graph.
+
+Nodes are normalized document numbers ('US10000000' for 'US10000000B2',
+kind codes and leading zeros removed) or, for applications which are only
+known by their application number, 'APP:' + country + number.
+"""
+from __future__ import annotations
+
+import array
+import json
+import mmap
+import re
+import struct
+from collections import deque
+from typing import Callable
+
+from parse_uspto_xml import setup_loggers
+
+
+# setup loggers
+logger = setup_loggers.setup_file_logger(__file__)
+
+EDGE_TYPES = [
+    "patent-reference",
+    "continuation",
+    "division",
+    "continuation-in-part",
+    "reissue",
+    "substitution",
+    "provisional",
+    "prior",
+    "priority-claim",
+    "application",  # publication -> its own application number
+]
+_EDGE_TYPE_IDS = {edge_type: i for i, edge_type in enumerate(EDGE_TYPES)}
+
+CITATION_EDGE_TYPES = {"patent-reference"}
+CONTINUATION_EDGE_TYPES = {"continuation", "division", "continuation-in-part"}
+FAMILY_EDGE_TYPES = set(EDGE_TYPES) - CITATION_EDGE_TYPES
+
+_MAGIC = b"USPTOCG1"
+# magic, n_nodes, n_edges
+_HEADER = struct.Struct("<8sQQ")
+
+_APPLICATION_PREFIX = "APP:"
+_DOC_NUMBER_RE = re.compile(r"^(?P<prefix>RE|PP|D|H|T)?0*(?P<number>\d+)(?P<kind>[A-Z]\d?)?$")
+
+
+def normalize_document_number(number: str, country: str | None = "US") -> str:
+    """
+    Normalizes a document number so citations and publications match, e.g.
+    'US10000000B2', '10000000' and '10,000,000' all become 'US10000000'.
+    """
+    cleaned = re.sub(r"[^0-9A-Z]", "", number.upper())
+    if len(cleaned) > 2 and cleaned[:2].isalpha() and cleaned[:2] not in ("RE", "PP"):
+        country, cleaned = cleaned[:2], cleaned[2:]
+    match = _DOC_NUMBER_RE.match(cleaned)
+    if match is not None:
+        cleaned = (match.group("prefix") or "") + match.group("number")
+    return (country or "") + cleaned
+
+
+def application_key(number: str, country: str | None = "US") -> str:
+    """Node key of an application known only by its application number."""
+    cleaned = re.sub(r"[^0-9A-Z]", "", number.upper())
+    return _APPLICATION_PREFIX + (country or "") + cleaned
+
+
+class CitationGraphBuilder:
+    """
+    Collects edges from parsed patents, e.g. while they are being loaded:
+
+        builder = CitationGraphBuilder()
+        load_local_files(files, builder.wrap(push_to_func))
+        builder.save("citations.graph")
+    """
+
+    def __init__(self):
+        self.node_ids = {}
+        self.sources = array.array("I")
+        self.targets = array.array("I")
+        self.edge_types = array.array("B")
+        self.ingested = set()
+
+    def _intern(self, key: str) -> int:
+        node_id = self.node_ids.get(key)
+        if node_id is None:
+            node_id = len(self.node_ids)
+            self.node_ids[key] = node_id
+        return node_id
+
+    def _get_target_key(self, document: dict) -> str | None:
+        document_type = document["document_type"]
+        reference = document["reference"]
+        country = document["country"] or "US"
+        if document_type in ["patent-reference", "prior", "reissue", "substitution"] \
+                or document_type in CONTINUATION_EDGE_TYPES:
+            if reference:
+                return normalize_document_number(reference, country)
+            parent_application = document["metadata"].get("application_number")
+            if parent_application:
+                return application_key(parent_application, country)
+        elif document_type in ["provisional", "priority-claim"] and reference:
+            return application_key(reference, country)
+        return None
+
+    def add_patents(self, patents: list[dict]):
+        """Adds the edges of parsed patents, patents already added are skipped."""
+        for patent in patents:
+            source_key = normalize_document_number(patent["publication_number"])
+            source = self._intern(source_key)
+            if source in self.ingested:
+                continue
+            self.ingested.add(source)
+
+            edges = {(
+                self._intern(application_key(patent["application_number"])),
+                _EDGE_TYPE_IDS["application"],
+            )}
+            for document in patent["referential_documents"]:
+                if document["document_type"] not in _EDGE_TYPE_IDS:
+                    continue  # other-reference (non-patent literature)
+                target_key = self._get_target_key(document)
+                if target_key is None or target_key == source_key:
+                    continue
+                edges.add((
+                    self._intern(target_key),
+                    _EDGE_TYPE_IDS[document["document_type"]],
+                ))
+
+            for target, edge_type in edges:
+                self.sources.append(source)
+                self.targets.append(target)
+                self.edge_types.append(edge_type)
+
+    def add_jsonl(self, filename: str):
+        """Adds the patents of a file written by `push_to_jsonl`."""
+        with open(filename, "r") as fp:
+            for line in fp:
+                if line.strip():
+                    self.add_patents([json.loads(line)])
+
+    def wrap(self, push_to_func: Callable) -> Callable:
+        """Returns a push_to_func which also adds the patents to the graph."""
+        def push_to_func_and_graph(patents):
+            push_to_func(patents)
+            self.add_patents(patents)
+        return push_to_func_and_graph
+
+    def save(self, filename: str):
+        """Writes the graph (sorted node names + CSR arrays) to `filename`."""
+        n_nodes = len(self.node_ids)
+        n_edges = len(self.sources)
+
+        # node ids follow the sorted node names so lookups can bisect
+        names = sorted(self.node_ids)
+        remap = array.array("I", bytes(4 * n_nodes))
+        for new_id, name in enumerate(names):
+            remap[self.node_ids[name]] = new_id
+        sources = array.array("I", (remap[node] for node in self.sources))
+        targets = array.array("I", (remap[node] for node in self.targets))
+
+        name_blob = bytearray()
+        name_offsets = array.array("Q", [0])
+        for name in names:
+            name_blob += name.encode("utf-8")
+            name_offsets.append(len(name_blob))
+
+        forward = _build_csr(n_nodes, sources, targets, self.edge_types)
+        backward = _build_csr(n_nodes, targets, sources, self.edge_types)
+
+        with open(filename, "wb") as fp:
+            fp.write(_HEADER.pack(_MAGIC, n_nodes, n_edges))
+            for section in [name_offsets, *forward, *backward, name_blob]:
+                _write_aligned(fp, section)
+        logger.info(f"Citation graph saved: {filename} ({n_nodes} nodes, {n_edges} edges)")
+
+
+def _build_csr(n_nodes, sources, targets, edge_types):
+    """Counting sort of the edges by source node."""
+    offsets = array.array("I", bytes(4 * (n_nodes + 1)))
+    for source in sources:
+        offsets[source + 1] += 1
+    for i in range(n_nodes):
+        offsets[i + 1] += offsets[i]
+
+    position = array.array("I", offsets[:-1])
+    csr_targets = array.array("I", bytes(4 * len(sources)))
+    csr_types = array.array("B", bytes(len(sources)))
+    for source, target, edge_type in zip(sources, targets, edge_types):
+        index = position[source]
+        csr_targets[index] = target
+        csr_types[index] = edge_type
+        position[source] += 1
+    return offsets, csr_targets, csr_types
+
+
+def _write_aligned(fp, section):
+    fp.write(section)
+    fp.write(b"\0" * (-fp.tell() % 8))
+
+
+class CitationGraph:
+    """Read-only, memory-mapped citation graph written by `CitationGraphBuilder`."""
+
+    def __init__(self, filename: str):
+        self._fp = open(filename, "rb")
+        self._mmap = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._mmap)
+
+        magic, self.n_nodes, self.n_edges = _HEADER.unpack_from(buffer)
+        if magic != _MAGIC:
+            raise ValueError(f"`{filename}` is not a citation graph file.")
+
+        position = _HEADER.size
+
+        def read_section(n_bytes, typecode):
+            nonlocal position
+            section = buffer[position:position + n_bytes]
+            position += n_bytes + (-n_bytes % 8)
+            return section.cast(typecode) if typecode else section
+
+        self._name_offsets = read_section(8 * (self.n_nodes + 1), "Q")
+        self._forward = (
+            read_section(4 * (self.n_nodes + 1), "I"),
+            read_section(4 * self.n_edges, "I"),
+            read_section(self.n_edges, "B"),
+        )
+        self._backward = (
+            read_section(4 * (self.n_nodes + 1), "I"),
+            read_section(4 * self.n_edges, "I"),
+            read_section(self.n_edges, "B"),
+        )
+        self._names = read_section(self._name_offsets[self.n_nodes], None)
+
+    def close(self):
+        for section in [self._name_offsets, *self._forward, *self._backward, self._names]:
+            section.release()
+        self._mmap.close()
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _name(self, node_id: int) -> str:
+        start = self._name_offsets[node_id]
+        end = self._name_offsets[node_id + 1]
+        return bytes(self._names[start:end]).decode("utf-8")
+
+    def _node_id(self, key: str) -> int | None:
+        target = key.encode("utf-8")
+        low, high = 0, self.n_nodes
+        while low < high:
+            middle = (low + high) // 2
+            start = self._name_offsets[middle]
+            name = bytes(self._names[start:self._name_offsets[middle + 1]])
+            if name < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.n_nodes and self._name(low) == key:
+            return low
+        return None
+
+    def _lookup(self, document_number: str) -> int | None:
+        if document_number.startswith(_APPLICATION_PREFIX):
+            return self._node_id(document_number)
+        return self._node_id(normalize_document_number(document_number))
+
+    @staticmethod
+    def _neighbors(csr, node_id: int, edge_types: set[str]):
+        offsets, targets, types = csr
+        for index in range(offsets[node_id], offsets[node_id + 1]):
+            if EDGE_TYPES[types[index]] in edge_types:
+                yield targets[index], EDGE_TYPES[types[index]]
+
+    def citations(self, document_number: str) -> list[str]:
+        """Documents cited by `document_number` (backward citations)."""
+        node_id = self._lookup(document_number)
+        if node_id is None:
+            return []
+        return [
+            self._name(target)
+            for target, _ in self._neighbors(self._forward, node_id, CITATION_EDGE_TYPES)
+        ]
+
+    def cited_by(self, document_number: str) -> list[str]:
+        """Documents citing `document_number` (forward citations)."""
+        node_id = self._lookup(document_number)
+        if node_id is None:
+            return []
+        return [
+            self._name(source)
+            for source, _ in self._neighbors(self._backward, node_id, CITATION_EDGE_TYPES)
+        ]
+
+    def family(self, document_number: str, max_size: int = 10000) -> list[str]:
+        """
+        Documents connected to `document_number` through continuations,
+        divisions, reissues, provisionals, priority claims and prior
+        publications, in either direction.
+        """
+        node_id = self._lookup(document_number)
+        if node_id is None:
+            return []
+        seen = {node_id}
+        queue = deque([node_id])
+        while queue and len(seen) < max_size:
+            current = queue.popleft()
+            for csr in [self._forward, self._backward]:
+                for neighbor, _ in self._neighbors(csr, current, FAMILY_EDGE_TYPES):
+                    if neighbor not in seen:
+                        seen.add(neighbor)
+                        queue.append(neighbor)
+        seen.discard(node_id)
+        return sorted(self._name(member) for member in seen)
+
+    def continuation_chain(self, document_number: str) -> list[str]:
+        """
+        Follows continuation / division / continuation-in-part parents from
+        `document_number` to the earliest known parent. Parents known only by
+        their application number are resolved to their publication when it is
+        in the graph.
+        """
+        node_id = self._lookup(document_number)
+        if node_id is None:
+            return []
+        chain = [node_id]
+        seen = {node_id}
+        while True:
+            parents = [
+                parent for parent, _ in
+                self._neighbors(self._forward, chain[-1], CONTINUATION_EDGE_TYPES)
+                if parent not in seen
+            ]
+            if not parents:
+                break
+            parent = min(parents)
+            # application number -> publication(s) of that application
+            publications = [
+                publication for publication, _ in
+                self._neighbors(self._backward, parent, {"application"})
+                if publication not in seen
+            ]
+            if publications:
+                parent = min(publications)
+            seen.add(parent)
+            chain.append(parent)
+        return [self._name(member) for member in chain]
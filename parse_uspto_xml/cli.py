@@ -0,0 +1,482 @@
+from __future__ import annotations
+
+import argparse
+import datetime
+import functools
+import logging
+import os
+import sys
+import time
+from typing import Callable
+
+from parse_uspto_xml import setup_loggers
+from parse_uspto_xml.parse_patent import (
+    get_dump_function,
+    get_push_errors,
+    load_local_files,
+)
+from parse_uspto_xml.profiling import SectionProfiler
+from parse_uspto_xml.scanner import scan_files
+from parse_uspto_xml.state_file import read_state, write_json
+from parse_uspto_xml.utils.parquet_interface import PATENT_FIELDS
+
+
+logger = setup_loggers.setup_file_logger(__file__)
+
+SINKS = ["postgres", "sqlite", "jsonl", "parquet"]
+# sink specific options, and the sinks they apply to
+SINK_OPTIONS = {
+    "no_referential": ["postgres", "sqlite"],
+    "array_columns": ["postgres"],
+    "hash_upsert": ["postgres"],
+    "search_index": ["postgres"],
+    "fts": ["sqlite"],
+    "fields": ["jsonl", "parquet"],
+}
+DEFAULT_OUTPUTS = {
+    "sqlite": "uspto_patents.sqlite",
+    "jsonl": "uspto_patents.jsonl",
+    "parquet": "uspto_patents.parquet",
+}
+
+
+def add_db_config_argument(group):
+    group.add_argument(
+        "--db-config", default="config/postgres.tsv",
+        help="postgres config file, used if the DATABASE_* env vars are not set",
+    )
+
+
+def add_postgres_arguments(group):
+    """The options of the postgres sink, shared by the load and the queue workers."""
+    add_db_config_argument(group)
+    group.add_argument("--table", default="uspto_patents", help="patents table name")
+    group.add_argument(
+        "--no-referential", action="store_true",
+        help="do not write the referential documents table",
+    )
+    group.add_argument(
+        "--array-columns", action="store_true",
+        help="postgres: write list fields as text[] instead of comma-joined strings",
+    )
+    group.add_argument(
+        "--hash-upsert", action="store_true",
+        help="postgres: only rewrite the abstract, description and claims of"
+             " an updated patent if their content hash changed (needs the"
+             " content_hashes column, see config/README.md)",
+    )
+    group.add_argument(
+        "--search-index", action="store_true",
+        help="postgres: update the full-text search index after the load"
+             " (see config/README.md)",
+    )
+
+
+def add_sink_arguments(parser: argparse.ArgumentParser):
+    """Adds the sink options, shared by the load and the replay, returns their group."""
+    sink = parser.add_argument_group("sink")
+    sink.add_argument("--sink", choices=SINKS, default="postgres")
+    sink.add_argument(
+        "--output", help="output file of the sqlite, jsonl and parquet sinks"
+    )
+    add_postgres_arguments(sink)
+    sink.add_argument("--fts", action="store_true", help="sqlite: build an FTS5 index")
+    sink.add_argument(
+        "--fields", type=lambda value: value.split(","),
+        help=f"jsonl / parquet: comma separated fields to keep, of {','.join(PATENT_FIELDS)}",
+    )
+    return sink
+
+
+def check_sink_arguments(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    """Rejects the options of other sinks, rather than ignoring them."""
+    for option, sinks in SINK_OPTIONS.items():
+        if getattr(args, option) and args.sink not in sinks:
+            parser.error(
+                f"--{option.replace('_', '-')} only applies to the"
+                f" {' and '.join(sinks)} sink{'s' if len(sinks) > 1 else ''}"
+            )
+    if args.fields:
+        unknown_fields = set(args.fields) - set(PATENT_FIELDS)
+        if unknown_fields:
+            parser.error(f"unknown --fields: {', '.join(sorted(unknown_fields))}")
+
+
+def open_sink(args: argparse.Namespace) -> tuple:
+    """Returns the sink's interface (None for jsonl) and its push_to_func."""
+    output = args.output or DEFAULT_OUTPUTS.get(args.sink)
+    db = None
+    if args.sink == "postgres":
+        from parse_uspto_xml.utils.db_interface import PGDBInterface
+        db = PGDBInterface(config_file=args.db_config, silent_logging=True)
+        push_to_func = get_postgres_dump_function(args, db)
+    elif args.sink == "sqlite":
+        from parse_uspto_xml.utils.sqlite_interface import SQLiteDBInterface
+        db = SQLiteDBInterface(output, patent_table_name=args.table, fts=args.fts)
+        push_to_func = get_dump_function(db, include_referential=not args.no_referential)
+    elif args.sink == "parquet":
+        from parse_uspto_xml.utils.parquet_interface import ParquetInterface
+        db = ParquetInterface(output, fields=args.fields)
+        push_to_func = get_dump_function(db)
+    else:
+        push_to_func = get_dump_function(output)
+        if args.fields:
+            push_all_fields = push_to_func
+
+            def push_to_func(patents):
+                push_all_fields([
+                    {field: patent[field] for field in args.fields} for patent in patents
+                ])
+    return db, push_to_func
+
+
+def close_sink(args: argparse.Namespace, db):
+    """Runs the post-load stages of the sink and closes it."""
+    if args.sink == "postgres":
+        if args.search_index:
+            db.update_search_index(patent_table_name=args.table)
+        db.close_db_connection()
+    elif args.sink == "sqlite":
+        db.finish_load()
+        db.close_db_connection()
+    elif args.sink == "parquet":
+        db.close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="parse-uspto-xml",
+        description="Parses USPTO bulk XML files and loads them into a sink.",
+        epilog="To share the ingestion between machines, see `parse-uspto-xml queue --help`."
+               " To load quarantined documents again, see `parse-uspto-xml replay --help`.",
+    )
+    parser.add_argument(
+        "inputs", nargs="+", help="xml files and / or directories of xml files"
+    )
+
+    sink = add_sink_arguments(parser)
+    sink.add_argument(
+        "--citation-graph", help="also build a citation graph file at this path"
+    )
+
+    performance = parser.add_argument_group("performance")
+    performance.add_argument(
+        "--workers", type=int, default=1, help="number of parsing processes"
+    )
+    performance.add_argument("--batch-size", type=int, default=50)
+    performance.add_argument(
+        "--limit-per-file", type=int, help="maximum number of documents per file"
+    )
+    performance.add_argument(
+        "--bytes-pipeline", action="store_true",
+        help="parse the documents from their bytes, without decoding and"
+             " unescaping them first. Escaped markup (e.g. &lt;sub&gt;) is"
+             " then kept in the text instead of being dropped",
+    )
+
+    filters = parser.add_argument_group("filters")
+    filters.add_argument("--status", choices=["granted", "pending"])
+    filters.add_argument("--published-after", help="YYYYMMDD, inclusive")
+    filters.add_argument("--published-before", help="YYYYMMDD, inclusive")
+    filters.add_argument(
+        "--classification", action="append",
+        help="keep patents with an IPC classification starting with this prefix,"
+             " e.g. G06F or 'G06F 16/', can be repeated",
+    )
+
+    run = parser.add_argument_group("run")
+    state = run.add_mutually_exclusive_group()
+    state.add_argument(
+        "--resume",
+        help="state file of the files already loaded, they are skipped and"
+             " each loaded file is added. A file interrupted part way, or"
+             " with batches which failed to push, is loaded again from its start.",
+    )
+    state.add_argument(
+        "--sync",
+        help="state file of a local mirror: only the files new or changed"
+             " (size, mtime and checksum) since they were last synced are"
+             " loaded, oldest week first",
+    )
+    run.add_argument("--quarantine", help="directory to keep documents which fail to parse")
+    run.add_argument("--metrics-output", help="write run metrics to this json file")
+    run.add_argument("--profile", action="store_true", help="time each parsing section")
+    run.add_argument(
+        "--profile-sample-rate", type=float, default=0.0,
+        help="fraction of the documents to also run under cProfile",
+    )
+    run.add_argument("--pstats-file", help="where to write the cProfile stats")
+    run.add_argument(
+        "--log-level", default="INFO",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+    )
+    return parser
+
+
+def build_queue_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="parse-uspto-xml queue",
+        description="Shares the ingestion of files between machines, with the"
+                    " PostgreSQL database as a work queue.",
+    )
+    parser.add_argument(
+        "--log-level", default="INFO",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="queue xml files to load")
+    enqueue.add_argument(
+        "inputs", nargs="+", help="xml files and / or directories of xml files,"
+                                  " at the same path on every worker"
+    )
+    enqueue.add_argument(
+        "--shard-size", type=int,
+        help="split the files into tasks of at most this many documents",
+    )
+    add_db_config_argument(enqueue)
+
+    work = commands.add_parser("work", help="load queued tasks until the queue is empty")
+    add_postgres_arguments(work)
+    work.add_argument("--batch-size", type=int, default=50)
+    work.add_argument(
+        "--poll-interval", type=float,
+        help="wait for new tasks, polling every this many seconds, instead of"
+             " exiting once the queue is empty",
+    )
+    work.add_argument(
+        "--stale-after", type=int, default=600,
+        help="seconds without a heartbeat after which a claimed task is claimed again",
+    )
+    work.add_argument("--max-attempts", type=int, default=3)
+
+    status = commands.add_parser("status", help="log the number of tasks in each status")
+    add_db_config_argument(status)
+    return parser
+
+
+def get_postgres_dump_function(args: argparse.Namespace, db) -> Callable:
+    return get_dump_function(
+        db,
+        patent_table_name=args.table,
+        include_referential=not args.no_referential,
+        array_columns=args.array_columns,
+        hash_columns=args.hash_upsert,
+    )
+
+
+def queue_main(argv: list[str]):
+    args = build_queue_parser().parse_args(argv)
+    setup_loggers.setup_root_logger(level=getattr(logging, args.log_level))
+
+    from parse_uspto_xml import work_queue
+    from parse_uspto_xml.utils.db_interface import PGDBInterface
+    db = PGDBInterface(config_file=args.db_config, silent_logging=True)
+    work_queue.create_queue_table(db)
+    if args.command == "enqueue":
+        work_queue.enqueue_files(db, args.inputs, shard_size=args.shard_size)
+    elif args.command == "work":
+        work_queue.run_worker(
+            db,
+            get_postgres_dump_function(args, db),
+            batch_size=args.batch_size,
+            stale_after=args.stale_after,
+            max_attempts=args.max_attempts,
+            poll_interval=args.poll_interval,
+        )
+        if args.search_index:
+            db.update_search_index(patent_table_name=args.table)
+    else:
+        logger.info(work_queue.get_queue_status(db))
+    db.close_db_connection()
+
+
+def build_replay_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="parse-uspto-xml replay",
+        description="Parses the quarantined documents again, e.g. after a parser"
+                    " fix. Documents which now parse are loaded into the sink and"
+                    " removed from the quarantine.",
+    )
+    parser.add_argument("quarantine", help="quarantine directory, see --quarantine")
+    add_sink_arguments(parser)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument(
+        "--log-level", default="INFO",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+    )
+    return parser
+
+
+def replay_main(argv: list[str]):
+    parser = build_replay_parser()
+    args = parser.parse_args(argv)
+    check_sink_arguments(parser, args)
+    setup_loggers.setup_root_logger(level=getattr(logging, args.log_level))
+
+    from parse_uspto_xml.quarantine import QuarantineSink, replay_quarantine
+    db, push_to_func = open_sink(args)
+    replay_quarantine(QuarantineSink(args.quarantine), push_to_func, batch_size=args.batch_size)
+    close_sink(args, db)
+
+
+COMMANDS = {
+    "queue": queue_main,
+    "replay": replay_main,
+}
+
+
+def get_patent_filter(args: argparse.Namespace) -> Callable[[dict], bool] | None:
+    """Builds the filter of the patents to keep from the filter options."""
+    conditions = []
+    if args.status:
+        conditions.append(lambda patent: patent["application_status"] == args.status)
+    if args.published_after:
+        conditions.append(lambda patent: patent["publication_date"] >= args.published_after)
+    if args.published_before:
+        conditions.append(lambda patent: patent["publication_date"] <= args.published_before)
+    if args.classification:
+        prefixes = tuple(args.classification)
+        conditions.append(lambda patent: any(
+            classification.startswith(prefixes)
+            for classification in patent["section_class_subclass_groups"]
+        ))
+    if not conditions:
+        return None
+    return lambda patent: all(condition(patent) for condition in conditions)
+
+
+def main(argv: list[str] | None = None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    check_sink_arguments(parser, args)
+
+    state_option = "--sync" if args.sync else "--resume" if args.resume else None
+    if state_option and args.limit_per_file:
+        parser.error(
+            f"--limit-per-file cannot be used with {state_option}, the partly"
+            " loaded files would be recorded as loaded"
+        )
+    if state_option and args.citation_graph:
+        parser.error(
+            f"--citation-graph cannot be used with {state_option}, the graph file"
+            " would only hold the patents of the files loaded by this run"
+        )
+
+    setup_loggers.setup_root_logger(level=getattr(logging, args.log_level))
+    db, push_to_func = open_sink(args)
+
+    citation_graph = None
+    if args.citation_graph:
+        from parse_uspto_xml.citation_graph import CitationGraphBuilder
+        citation_graph = CitationGraphBuilder()
+
+    metrics = {
+        "started_at": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "sink": args.sink,
+        "workers": args.workers,
+        "batch_size": args.batch_size,
+        "filtered_out": 0,
+        "files": [],
+    }
+
+    patent_filter = get_patent_filter(args)
+
+    def push_selected(patents):
+        if patent_filter is not None:
+            kept_patents = [patent for patent in patents if patent_filter(patent)]
+            metrics["filtered_out"] += len(patents) - len(kept_patents)
+            patents = kept_patents
+        push_to_func(patents)
+        # the sinks only drop the fields left out by --fields from their copy
+        if citation_graph is not None:
+            citation_graph.add_patents(patents)
+
+    resume_state = read_state(args.resume)
+    filenames = []
+    if not args.sync:
+        for filename, _ in scan_files(args.inputs):
+            if os.path.abspath(filename) in resume_state["files"]:
+                logger.info(f"Skipping loaded file: {filename}")
+                continue
+            filenames.append(filename)
+
+    def on_file_loaded(filename, count, success_count, errors):
+        metrics["files"].append({
+            "filename": filename,
+            "documents": count,
+            "parsed": success_count,
+            "errors": count - success_count,
+        })
+        push_errors = get_push_errors(errors)
+        if args.resume and push_errors:
+            logger.error(
+                f"{len(push_errors)} batches of {filename} failed to push,"
+                " it is not recorded as loaded"
+            )
+        elif args.resume:
+            resume_state["files"][os.path.abspath(filename)] = {
+                "loaded_at": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                "documents": count,
+                "parsed": success_count,
+            }
+            write_json(args.resume, resume_state)
+
+    profiler = None
+    if args.profile or args.profile_sample_rate:
+        profiler = SectionProfiler(
+            sample_rate=args.profile_sample_rate, pstats_file=args.pstats_file
+        )
+
+    quarantine = None
+    if args.quarantine:
+        from parse_uspto_xml.quarantine import QuarantineSink
+        quarantine = QuarantineSink(args.quarantine)
+
+    load_func = load_local_files
+    if args.sync:
+        from parse_uspto_xml.sync import sync_local_files
+        # lists the mirror itself, for the files to sync
+        load_func = functools.partial(sync_local_files, state_file=args.sync)
+        filenames = args.inputs
+
+    start_time = time.perf_counter()
+    count, success_count, _ = load_func(
+        dirpath_list=filenames,
+        push_to_func=push_selected,
+        limit_per_file=args.limit_per_file,
+        batch_size=args.batch_size,
+        profiler=profiler,
+        quarantine=quarantine,
+        workers=args.workers,
+        on_file_loaded=on_file_loaded,
+        bytes_pipeline=args.bytes_pipeline,
+    )
+    load_seconds = time.perf_counter() - start_time
+
+    close_sink(args, db)
+    if citation_graph is not None:
+        citation_graph.save(args.citation_graph)
+
+    if args.metrics_output:
+        metrics.update({
+            "documents": count,
+            "parsed": success_count,
+            "errors": count - success_count,
+            "load_seconds": round(load_seconds, 3),
+            "total_seconds": round(time.perf_counter() - start_time, 3),
+            "documents_per_second": round(count / load_seconds, 3) if load_seconds else None,
+        })
+        if profiler is not None:
+            metrics["profile"] = profiler.summary()
+        write_json(args.metrics_output, metrics)
+        logger.info(f"Metrics written to {args.metrics_output}")
+
+
+if __name__ == "__main__":
+    main()
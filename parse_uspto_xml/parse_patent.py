@@ -1,52 +1,80 @@
 from __future__ import annotations
 
 import datetime
+import functools
+import hashlib
 import html
 import json
 import os
 import re
-import sys
-from typing import Union, Callable
+from typing import TYPE_CHECKING, Union, Callable
 
-from bs4 import BeautifulSoup
-import psycopg2.extras
-
-# load the psycopg to connect to postgresql
 from parse_uspto_xml import setup_loggers
+from parse_uspto_xml.profiling import NULL_TIMER, SectionProfiler
+from parse_uspto_xml.scanner import (
+    ByteProgress,
+    format_bytes,
+    scan_files,
+)
+from parse_uspto_xml.transport import MmapSource, SharedMemorySource, open_source
 from parse_uspto_xml.utils.db_interface import PGDBInterface
+from parse_uspto_xml.utils.parquet_interface import ParquetInterface
+from parse_uspto_xml.utils.sqlite_interface import SQLiteDBInterface
+
+if TYPE_CHECKING:
+    from parse_uspto_xml.quarantine import QuarantineSink
 
 
 # setup loggers
-setup_loggers.setup_root_logger()
 logger = setup_loggers.setup_file_logger(__file__)
 
+# every document in a USPTO bulk file begins with this declaration
+XML_DECLARATION = "<?xml version=\"1.0\" encoding=\"UTF-8\"?>"
 
-def get_filenames_from_dir(dirpaths: list | str):
-    """Get filenames from directory"""
 
-    if isinstance(dirpaths, str):
-        dirpaths = [dirpaths]
+class PushError(Exception):
+    """A batch of parsed patents which could not be pushed to the sink."""
+
+
+def get_push_errors(errors: list) -> list:
+    """The errors of a load raised while pushing batches, not while parsing documents."""
+    return [error for error in errors if isinstance(error[2], PushError)]
 
-    filenames = []
-    for dirpath in dirpaths:
-        # Load listed directories
-        if os.path.isdir(dirpath):
-            logger.info(f"directory: {dirpath}")
-            for filename in os.listdir(dirpath):
-                fullpath = os.path.join(dirpath, filename)
-                dir_filenames = [fullpath]
-                if os.path.isdir(fullpath):
-                    dir_filenames = get_filenames_from_dir([fullpath])
-                filenames += dir_filenames
-        else:
-            filenames += [dirpath]
-    return filenames
+
+def get_filenames_from_dir(dirpaths: list | str) -> list[str]:
+    """
+    Get filenames from directory, the bulk files only (see `scan_files`,
+    which also returns their sizes).
+    """
+    return [filename for filename, _ in scan_files(dirpaths)]
 
 
-def parse_uspto_file(bs, keep_log: bool = False):
+def count_documents_in_file(filename: str, chunk_size: int = 1 << 24) -> int:
+    """Counts the XML documents in a USPTO bulk file without loading it."""
+    delimiter = XML_DECLARATION.encode("utf-8")
+    count = 0
+    tail = b""
+    with open(filename, "rb") as fp:
+        while True:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                break
+            buffer = tail + chunk
+            count += buffer.count(delimiter)
+            # keep enough bytes to catch a delimiter split across chunks
+            tail = buffer[-(len(delimiter) - 1):]
+    return count
+
+
+def parse_uspto_file(bs, keep_log: bool = False, timer=None):
     """
     Parses a USPTO patent in a BeautifulSoup object.
+
+    If a `timer` (see `profiling.DocumentTimer`) is given, the time spent
+    extracting each section is recorded on it.
     """
+    if timer is None:
+        timer = NULL_TIMER
 
     patent_office = "uspto"
     grant_date = None
@@ -62,6 +90,7 @@ def parse_uspto_file(bs, keep_log: bool = False):
     application_type = application_ref_bs['appl-type']
     application_date = application_ref_bs.find('date').text
     application_number = application_ref_bs.find('doc-number').text
+    timer.lap("metadata")
 
     referential_documents = []
     # {uspto_patents.publication_number,reference,cited_by_examiner,document_type,country,metadata (JSON)
@@ -116,6 +145,7 @@ def parse_uspto_file(bs, keep_log: bool = False):
         else:
             raise KeyError(f"'{related_doc_bs.name}' is not setup to be included in referential documents.")
         referential_documents.append(related_doc)
+    timer.lap("related_documents")
 
     references = []
     refs_cited_bs = bs.find(re.compile(".*-references-cited"))
@@ -151,6 +181,7 @@ def parse_uspto_file(bs, keep_log: bool = False):
                 }
             references.append(reference)
         referential_documents += references
+    timer.lap("references")
 
     priority_claims = []
     priority_docs_bs = bs.find("priority-claims")
@@ -162,7 +193,7 @@ def parse_uspto_file(bs, keep_log: bool = False):
                 "application_number": application_number,
                 "reference": doc_bs.find("doc-number").text,
                 "cited_by_examiner": False,
-                "document_type": "other-reference",
+                "document_type": "priority-claim",
                 "country": getattr(doc_bs.find("country"), "text", None),
                 "kind": None,
                 "metadata":{
@@ -192,6 +223,7 @@ def parse_uspto_file(bs, keep_log: bool = False):
                 f"{missing_keys} and bad_keys: {bad_keys} "
                 f"for {reference}"
             )
+    timer.lap("priority_claims")
 
     # International Patent Classification (IPC) Docs:
     # https://www.wipo.int/classifications/ipc/en/
@@ -245,6 +277,7 @@ def parse_uspto_file(bs, keep_log: bool = False):
                     section_classes[section_class] = True
                     section_class_subclasses[section_subclass] = True
                     section_class_subclass_groups[section_subclass + " " + group] = True
+    timer.lap("classifications")
 
     def build_name(bs_el):
         """Creates a name '<First> <Last>'"""
@@ -303,18 +336,22 @@ def parse_uspto_file(bs, keep_log: bool = False):
                     org_name = build_org(el)
                     if org_name:
                         attorney_organizations.append(org_name)
+    timer.lap("parties")
 
     abstracts = []
     for el in bs.find_all('abstract'):
         abstracts.append(el.text.strip('\n'))
+    timer.lap("abstract")
 
     descriptions = []
     for el in bs.find_all('description'):
         descriptions.append(el.text.strip('\n'))
+    timer.lap("description")
 
     claims = []
     for el in bs.find_all('claim'):
         claims.append(el.text.strip('\n'))
+    timer.lap("claims")
 
     uspto_patent = {
         "publication_title": publication_title,
@@ -394,7 +431,118 @@ def parse_uspto_file(bs, keep_log: bool = False):
     return uspto_patent
 
 
-def write_patent_to_db(patents, patent_table_name, db=None):
+PATENT_COLUMNS = [
+    "publication_title",
+    "publication_number",
+    "publication_date",
+    "publication_type",
+    "grant_date",
+    "application_number",
+    "application_date",
+    "application_status",
+    "patent_office",
+    "authors",
+    "organizations",
+    "attorneys",
+    "attorney_organizations",
+    "sections",
+    "section_classes",
+    "section_class_subclasses",
+    "section_class_subclass_groups",
+    "abstract",
+    "description",
+    "claims",
+    "created_at",
+    "updated_at",
+]
+
+LIST_COLUMNS = [
+    "authors", "organizations", "attorneys", "attorney_organizations",
+    "sections", "section_classes", "section_class_subclasses",
+    "section_class_subclass_groups",
+]
+
+# large text columns only rewritten when their hash changed, see `write_patent_to_db`
+HASHED_COLUMNS = ["abstract", "description", "claims"]
+
+REFERENTIAL_DOCUMENT_COLUMNS = [
+    "uspto_publication_number",
+    "reference",
+    "cited_by_examiner",
+    "document_type",
+    "country",
+    "metadata",
+    "kind",
+    "created_at",
+    "updated_at",
+]
+
+
+def _jsonify_dicts(value):
+    if isinstance(value, dict):
+        return json.dumps(value)
+    return value
+
+
+def get_patent_column_value(data, column, current_time, array_columns=False):
+    """Gets the value of a patents table column from a parsed patent."""
+    if column in ["created_at", "updated_at"]:
+        return current_time
+    elif column in ["publication_type"]:
+        return data.get("application_type")
+    elif column in ["abstract", "description", "claims"]:
+        if column == "description":
+            column = "descriptions"
+        return '\n'.join(data.get(column))
+    elif column in LIST_COLUMNS:
+        if array_columns:
+            return list(data.get(column))
+        return ','.join(data.get(column))
+    return data.get(column)
+
+
+def get_content_hash(value: str) -> str:
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+
+def deduplicate_patents(patents: list[dict]) -> list[dict]:
+    """
+    Keeps one patent per (application_number, patent_office), the one with
+    the newest publication date (the first one on ties), as upserting them
+    one after the other would.
+    """
+    deduplicated = {}
+    for data in patents:
+        key = (data.get("application_number"), data.get("patent_office"))
+        kept = deduplicated.get(key)
+        if kept is None or (data.get("publication_date") or "") > (kept.get("publication_date") or ""):
+            deduplicated[key] = data
+    return list(deduplicated.values())
+
+
+def get_referential_document_column_value(data, column, current_time):
+    """Gets the value of a referential documents table column from a parsed reference."""
+    if column in ["created_at", "updated_at"]:
+        return current_time
+    elif column == "uspto_publication_number":
+        return data.get("publication_number")
+    return data.get(column)
+
+
+def write_patent_to_db(patents, patent_table_name, db=None, array_columns=False,
+                       hash_columns=False):
+    """
+    Upserts patents into `patent_table_name`.
+
+    If `array_columns` is set, the list fields (authors, organizations,
+    sections, ...) are written as native `text[]` arrays instead of
+    comma-joined strings, see config/README.md for the table definition.
+
+    If `hash_columns` is set, the hashes of the large text columns
+    (HASHED_COLUMNS) are stored in the `content_hashes` jsonb column and
+    an update only rewrites those whose hash changed, the others keep
+    their stored (TOASTed) value.
+    """
 
     """
     import pprint
@@ -420,30 +568,11 @@ def write_patent_to_db(patents, patent_table_name, db=None):
     if db_cursor is None:
         return
 
-    columns = [
-        "publication_title",
-        "publication_number",
-        "publication_date",
-        "publication_type",
-        "grant_date",
-        "application_number",
-        "application_date",
-        "application_status",
-        "patent_office",
-        "authors",
-        "organizations",
-        "attorneys",
-        "attorney_organizations",
-        "sections",
-        "section_classes",
-        "section_class_subclasses",
-        "section_class_subclass_groups",
-        "abstract",
-        "description",
-        "claims",
-        "created_at",
-        "updated_at",
-    ]
+    import psycopg2.extras
+
+    columns = PATENT_COLUMNS
+    if hash_columns:
+        columns = PATENT_COLUMNS + ["content_hashes"]
     read_only_cols = {"created_at"}
     conflict_columns = {"application_number", "patent_office"}
     updateable_cols = set(columns).difference(conflict_columns).difference(read_only_cols)
@@ -454,30 +583,28 @@ def write_patent_to_db(patents, patent_table_name, db=None):
         format_str = ', '.join(["\"{}\""] * n_values)
         return f"({format_str})".format(*values)
 
-    def jsonify_dicts(value):
-        if isinstance(value, dict):
-            return json.dumps(value)
-        return value
-
     def get_data_for_column(data, column):
-        if column in ["created_at", "updated_at"]:
-            return current_time
-        elif column in ["publication_type"]:
-            return data.get("application_type")
-        elif column in ["abstract", "description", "claims"]:
-            if column == "description":
-                column = "descriptions"
-            return '\n'.join(data.get(column))
-        elif column in [
-            "authors", "organizations", "attorneys", "attorney_organizations",
-            "sections", "section_classes", "section_class_subclasses",
-            "section_class_subclass_groups",
-        ]:
-            return ','.join(data.get(column))
-        return data.get(column)
+        return get_patent_column_value(data, column, current_time, array_columns)
+
+    def get_row(data):
+        row = {column: get_data_for_column(data, column) for column in PATENT_COLUMNS}
+        if hash_columns:
+            row["content_hashes"] = {
+                column: get_content_hash(row[column]) for column in HASHED_COLUMNS
+            }
+        return [_jsonify_dicts(row[column]) for column in columns]
+
+    def get_excluded_value(col):
+        if hash_columns and col in HASHED_COLUMNS:
+            return (
+                f"CASE WHEN EXCLUDED.content_hashes->>'{col}'"
+                f" IS DISTINCT FROM {patent_table_name}.content_hashes->>'{col}'"
+                f" THEN EXCLUDED.{col} ELSE {patent_table_name}.{col} END"
+            )
+        return "EXCLUDED.{:s}".format(col)
 
     exclude_set_string = "({})".format(", ".join([
-        "EXCLUDED.{:s}".format(col) for col in updateable_cols
+        get_excluded_value(col) for col in updateable_cols
     ]))
     newer_than_only = ""
     if newer_than_col:
@@ -494,15 +621,30 @@ def write_patent_to_db(patents, patent_table_name, db=None):
                 ON CONFLICT {tuple_creator(conflict_columns)} DO UPDATE
                 SET {tuple_creator(updateable_cols)} = {exclude_set_string}
                 {newer_than_only}""",
-        [
-            [ jsonify_dicts(get_data_for_column(data, column)) for column in columns ]
-                for data in patents
-        ]
+        # a row can only be upserted once per statement
+        [ get_row(data) for data in deduplicate_patents(patents) ]
     )
     logger.debug(f"DB UPSERT message: {db_cursor.statusmessage}")
     return
 
 
+def get_stored_publication_numbers(publication_numbers, patent_table_name, db=None):
+    """Returns the `publication_numbers` which are in `patent_table_name`."""
+    db_cursor = None
+    if db is not None:
+        db_cursor = db.obtain_db_cursor()
+
+    if db_cursor is None or not publication_numbers:
+        return set()
+
+    db_cursor.execute(
+        f"""SELECT publication_number FROM {patent_table_name}
+                WHERE publication_number = ANY(%s)""",
+        (list(publication_numbers),)
+    )
+    return {row[0] for row in db_cursor.fetchall()}
+
+
 def write_referential_documents_to_db(document_list, db=None):
     """"""
     # Will use for created_at & updated_at time
@@ -516,17 +658,9 @@ def write_referential_documents_to_db(document_list, db=None):
     if db_cursor is None:
         return
 
-    columns = [
-        "uspto_publication_number",
-        "reference",
-        "cited_by_examiner",
-        "document_type",
-        "country",
-        "metadata",
-        "kind",
-        "created_at",
-        "updated_at",
-    ]
+    import psycopg2.extras
+
+    columns = REFERENTIAL_DOCUMENT_COLUMNS
     # read_only_cols = {"created_at"}
     # conflict_columns = {"uspto_publication_number", "reference", "document_type", "country", "kind"}
     # updateable_cols = set(columns).difference(conflict_columns).difference(read_only_cols)
@@ -537,15 +671,8 @@ def write_referential_documents_to_db(document_list, db=None):
         format_str = ', '.join(["\"{}\""] * n_values)
         return f"({format_str})".format(*values)
 
-    def jsonify_dicts(value):
-        if isinstance(value, dict):
-            return json.dumps(value)
-        return value
-
     def get_data_for_column(data, column):
-        if column in ["created_at", "updated_at"]:
-            return current_time
-        return data.get(column)
+        return get_referential_document_column_value(data, column, current_time)
 
     # exclude_set_string = "({})".format(", ".join([
     #     "EXCLUDED.{:s}".format(col) for col in updateable_cols
@@ -560,7 +687,7 @@ def write_referential_documents_to_db(document_list, db=None):
                 # ON CONFLICT {tuple_creator(conflict_columns)} DO UPDATE
                 # SET {tuple_creator(updateable_cols)} = {exclude_set_string}""",
         [
-            [ jsonify_dicts(get_data_for_column(data, column)) for column in columns ]
+            [ _jsonify_dicts(get_data_for_column(data, column)) for column in columns ]
                 for data in document_list
         ]
     )
@@ -569,29 +696,64 @@ def write_referential_documents_to_db(document_list, db=None):
 
 
 def load_batch_from_data(
-        xml_text_list: list[str],
-        keep_log: bool = False
+        xml_text_list: list[str | bytes],
+        keep_log: bool = False,
+        profiler: SectionProfiler | None = None,
+        unescape: bool = False,
+        quarantine: QuarantineSink | None = None,
+        source_file: str | None = None,
+        byte_offsets: list[int] | None = None,
     ):
+    """
+    Parses a list of XML documents.
+
+    Documents which fail to parse are added to the `quarantine`, if given,
+    along with their `source_file` and `byte_offsets` (one per document).
+    With `unescape`, html entities are unescaped before parsing. Documents
+    given as (UTF-8) bytes are parsed as is, lxml decodes them and resolves
+    their entities itself, without a separate decode and `html.unescape`
+    of the whole document (BeautifulSoup still builds a `str` per text
+    node). Escaped markup (e.g. `&lt;sub&gt;`) is then kept as text, where
+    unescaping first would parse it as tags and drop it.
+    """
 
     count = 0
     success_count = 0
     errors = []
     patent_list = []
 
-    for patent in xml_text_list:
+    # imported here so importing this module stays fast
+    from bs4 import BeautifulSoup
+
+    for i, patent in enumerate(xml_text_list):
 
-        if patent is None or patent == "":
+        if not patent:
             continue
 
-        bs = BeautifulSoup(patent, "lxml")
+        raw_patent = patent
+        markup_kwargs = {}
+        if isinstance(patent, bytes):
+            markup_kwargs["from_encoding"] = "utf-8"
+        elif unescape:
+            patent = html.unescape(patent)
+
+        timer = NULL_TIMER
+        if profiler is not None:
+            timer = profiler.start_document(len(patent))
+
+        bs = BeautifulSoup(patent, "lxml", **markup_kwargs)
+        timer.lap("soup")
 
         if bs.find('sequence-cwu') is not None:
+            if profiler is not None:
+                profiler.finish_document(timer, skipped=True)
             continue # Skip DNA sequence documents
 
         application = bs.find('us-patent-application')
         if application is None: # If no application, search for grant
             application = bs.find('us-patent-grant')
         title = "None"
+        timer.lap("find_document")
 
         try:
             title = application.find('invention-title').text
@@ -601,7 +763,8 @@ def load_batch_from_data(
         try:
             uspto_patent = parse_uspto_file(
                 bs=application,
-                keep_log=keep_log
+                keep_log=keep_log,
+                timer=timer,
             )
             patent_list.append(uspto_patent)
             success_count += 1
@@ -609,36 +772,54 @@ def load_batch_from_data(
             exception_tuple = (count, title, e)
             errors.append(exception_tuple)
             logger.error(f"Error: {exception_tuple}", exc_info=True)
+            if quarantine is not None:
+                quarantine.add(
+                    raw_patent,
+                    source_file,
+                    byte_offsets[i] if byte_offsets is not None else None,
+                    title,
+                    e,
+                    unescape=unescape,
+                )
+        if profiler is not None:
+            profiler.finish_document(timer)
         count += 1
 
     return count, success_count, patent_list, errors
 
 
-def load_from_data(
-        xml_text: str,
+def _iter_batch_ranges(n_documents: int, batch_size: int, max_patents: int | None):
+    """(start, end) indexes of the batches of documents to parse."""
+    for i in range(0, n_documents, batch_size):
+        last_index = i + batch_size
+        if max_patents:
+            last_index = min(max_patents, i + batch_size)
+        if i >= last_index:
+            break
+        yield i, last_index
+
+
+def _push_batch_results(
+        results,
         filename: str,
         push_to_func: Callable,
-        batch_size: int = 50,
+        profiler: SectionProfiler | None = None,
         max_patents: int | None = None,
-        keep_log: bool = False
     ):
-
+    """
+    Pushes the parsed batches, `results` yields (batch result, exported
+    profile). A batch which fails to push is added to the errors as a
+    `PushError` (see `get_push_errors`), its patents are not counted as
+    parsed.
+    """
     count = 0
     success_count = 0
     errors = []
 
-    xml_splits = xml_text.split("<?xml version=\"1.0\" encoding=\"UTF-8\"?>")
-    if len(xml_splits) and not xml_splits[0]:
-        xml_splits = xml_splits[1:]
-    for i in range(0, len(xml_splits), batch_size):
-
-        last_index = i + batch_size
-        if max_patents:
-            last_index = min(max_patents, i + batch_size)
-
-        xml_batch = xml_splits[i : last_index]
-        batch_count, batch_success_count, patents, batch_errors = \
-            load_batch_from_data(xml_batch, keep_log)
+    for batch_result, batch_profile in results:
+        batch_count, batch_success_count, patents, batch_errors = batch_result
+        if batch_profile is not None:
+            profiler.merge(batch_profile)
         count += batch_count
 
         recent_title = None
@@ -649,7 +830,9 @@ def load_from_data(
             push_to_func(patents)
             logger.info(f"{count}, {filename}, {recent_title}")
         except Exception as e:
-            exception_tuple = (count, recent_title, e)
+            push_error = PushError(f"{len(patents)} patents not pushed: {e!r}")
+            push_error.__cause__ = e
+            exception_tuple = (count, recent_title, push_error)
             errors.append(exception_tuple)
             logger.error(f"Error: {exception_tuple}", exc_info=True)
             batch_success_count = 0
@@ -663,38 +846,228 @@ def load_from_data(
     return count, success_count, errors
 
 
+def load_from_data(
+        xml_text: str,
+        filename: str,
+        push_to_func: Callable,
+        batch_size: int = 50,
+        max_patents: int | None = None,
+        keep_log: bool = False,
+        start_index: int = 0,
+        profiler: SectionProfiler | None = None,
+        unescape: bool = False,
+        quarantine: QuarantineSink | None = None,
+    ):
+    """
+    Splits `xml_text` into documents, parses them in batches of
+    `batch_size` and pushes each batch with `push_to_func`.
+
+    Documents quarantined from here have no byte offset, `xml_text` may
+    not be the bytes of `filename` (see `load_from_source` for files).
+    """
+
+    xml_splits = xml_text.split(XML_DECLARATION)
+    if len(xml_splits) and not xml_splits[0]:
+        xml_splits = xml_splits[1:]
+    if start_index:
+        xml_splits = xml_splits[start_index:]
+
+    results = (
+        (
+            load_batch_from_data(
+                xml_splits[i : last_index],
+                keep_log=keep_log,
+                profiler=profiler,
+                unescape=unescape,
+                quarantine=quarantine,
+                source_file=filename,
+            ),
+            None,
+        )
+        for i, last_index in _iter_batch_ranges(len(xml_splits), batch_size, max_patents)
+    )
+    return _push_batch_results(results, filename, push_to_func, profiler, max_patents)
+
+
+def _load_spans(source, spans, profiler=None, bytes_pipeline=False, **kwargs):
+    """
+    `load_batch_from_data` for documents at (offset, length) `spans` of a
+    source, passed as bytes or, without `bytes_pipeline`, as unescaped text.
+    """
+    # released here, exceptions kept in the errors would keep it alive
+    with source.buffer() as buffer:
+        xml_batch = [bytes(buffer[offset : offset + length]) for offset, length in spans]
+    if not bytes_pipeline:
+        xml_batch = [xml_bytes.decode("utf-8") for xml_bytes in xml_batch]
+    return load_batch_from_data(
+        xml_batch,
+        profiler=profiler,
+        unescape=True,
+        byte_offsets=[offset for offset, _ in spans],
+        **kwargs
+    )
+
+
+def _load_spans_in_worker(spans, source=None, sample_rate=None, **kwargs):
+    """`_load_spans` for a pool worker, returns its profile as well."""
+    profiler = None
+    if sample_rate is not None:
+        profiler = SectionProfiler(sample_rate=sample_rate)
+    result = _load_spans(source, spans, profiler=profiler, **kwargs)
+    return result, profiler.export() if profiler is not None else None
+
+
+def load_from_source(
+        source: MmapSource | SharedMemorySource,
+        filename: str,
+        push_to_func: Callable,
+        batch_size: int = 50,
+        max_patents: int | None = None,
+        keep_log: bool = False,
+        start_index: int = 0,
+        profiler: SectionProfiler | None = None,
+        quarantine: QuarantineSink | None = None,
+        pool=None,
+        bytes_pipeline: bool = False,
+        on_progress: Callable | None = None,
+    ):
+    """
+    Like `load_from_data`, for a file mapped by a `transport` source.
+
+    Only the (offset, length) of the documents are sent to the `pool`,
+    each worker reads its documents from the memory mapped file (or
+    shared memory) itself. With `bytes_pipeline`, the documents are parsed
+    from their bytes (see `load_batch_from_data`), otherwise they are
+    decoded and unescaped first. `on_progress(fraction)` is called after
+    each pushed batch with the fraction of the source's bytes loaded.
+    """
+    spans = source.spans()
+    source_size = spans[-1][0] + spans[-1][1] if spans else 0
+    if start_index:
+        spans = spans[start_index:]
+
+    batches = [
+        spans[i : last_index]
+        for i, last_index in _iter_batch_ranges(len(spans), batch_size, max_patents)
+    ]
+    batch_kwargs = {
+        "keep_log": keep_log,
+        "quarantine": quarantine,
+        "source_file": filename,
+        "bytes_pipeline": bytes_pipeline,
+    }
+    if pool is None:
+        results = (
+            (_load_spans(source, batch_spans, profiler=profiler, **batch_kwargs), None)
+            for batch_spans in batches
+        )
+    else:
+        results = pool.imap(
+            functools.partial(
+                _load_spans_in_worker,
+                source=source,
+                sample_rate=profiler.sample_rate if profiler is not None else None,
+                **batch_kwargs,
+            ),
+            batches,
+        )
+    if on_progress is not None and source_size:
+        results = _report_progress(results, batches, source_size, on_progress)
+
+    return _push_batch_results(results, filename, push_to_func, profiler, max_patents)
+
+
+def _report_progress(results, batches, source_size, on_progress):
+    """Calls `on_progress` once each batch of `results` was pushed."""
+    for result, batch_spans in zip(results, batches):
+        yield result
+        offset, length = batch_spans[-1]
+        on_progress((offset + length) / source_size)
+
+
 def load_local_files(
         dirpath_list:  list,
         push_to_func: Callable,
         limit_per_file: Union[int, None] = None,
         batch_size: int = 50,
         keep_log: bool = False,
+        profiler: SectionProfiler | None = None,
+        quarantine: QuarantineSink | None = None,
+        workers: int = 1,
+        on_file_loaded: Callable | None = None,
+        bytes_pipeline: bool = False,
 ):
-    """Load all files from local directory"""
+    """
+    Load all files from local directory
+
+    If a `profiler` is given, per section timings are logged at the end
+    (and its sampled cProfile stats are written, if it has a pstats_file).
+    Documents which fail to parse are kept in the `quarantine`, if given.
+    Files are memory mapped (`.zip` files of bulk XML are decompressed
+    once, into shared memory for the `workers` or to a temporary file
+    otherwise, see `transport`), the whole file is never
+    decoded. With `bytes_pipeline`, the documents are parsed from their
+    bytes instead of being decoded and unescaped one by one, which keeps
+    escaped markup in the text (see `load_batch_from_data`).
+    With `workers` > 1, documents are parsed by a pool of processes, which
+    read them from the mapped file themselves.
+    The progress and ETA are logged from the bytes loaded out of the total
+    size of the files.
+    `on_file_loaded(filename, count, success_count, errors)` is called
+    after each file.
+    """
     logger.info("LOADING FILES TO PARSE\n----------------------------")
-    filenames = get_filenames_from_dir(dirpath_list)
+    files = scan_files(dirpath_list)
+    total_bytes = sum(size for _, size in files)
+    logger.info(f"{len(files)} files to load, {format_bytes(total_bytes)}")
+    progress = ByteProgress(total_bytes)
+    done_bytes = 0
+
+    pool = None
+    if workers > 1:
+        import multiprocessing
+        if os.name == "posix":
+            # started before the workers so they share it, otherwise each
+            # would track (and report as leaked) the shared memory of .zip files
+            from multiprocessing import resource_tracker
+            resource_tracker.ensure_running()
+        pool = multiprocessing.Pool(workers)
 
     count = 0
     success_count = 0
     errors = []
-    for filename in filenames:
-        if not filename.endswith(".xml"):
-            continue
-
-        with open(filename, "r") as fp:
-            xml_text = html.unescape(fp.read())
-
-        batch_count, batch_success_count, batch_errors = load_from_data(
-            xml_text,
-            filename,
-            push_to_func,
-            batch_size,
-            max_patents=limit_per_file,
-            keep_log=keep_log,
-        )
+    for filename, size in files:
+        # the file is memory mapped (or decompressed into shared memory) and
+        # its documents are read as bytes, workers only get their positions
+        source = open_source(filename, shared=pool is not None)
+        try:
+            batch_count, batch_success_count, batch_errors = load_from_source(
+                source,
+                filename,
+                push_to_func,
+                batch_size,
+                max_patents=limit_per_file,
+                keep_log=keep_log,
+                profiler=profiler,
+                quarantine=quarantine,
+                pool=pool,
+                bytes_pipeline=bytes_pipeline,
+                on_progress=lambda fraction: progress.update(done_bytes + fraction * size),
+            )
+        finally:
+            source.close()
+        done_bytes += size
+        progress.update(done_bytes)
         count += batch_count
         success_count += batch_success_count
         errors += batch_errors
+        if on_file_loaded is not None:
+            on_file_loaded(filename, batch_count, batch_success_count, batch_errors)
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+    progress.update(done_bytes, force=True)
 
     if errors:
         logger.error("\n\nErrors\n------------------------\n")
@@ -705,6 +1078,12 @@ def load_local_files(
     logger.info(f"Success Count: {success_count}")
     logger.info(f"Error Count: {count - success_count}")
 
+    if profiler is not None:
+        profiler.log_summary()
+        profiler.dump_stats()
+
+    return count, success_count, errors
+
 
 def push_to_jsonl(patents: list[dict], push_to: str):
     patent_dumps_list = []
@@ -719,50 +1098,112 @@ def push_to_db(
         push_to: PGDBInterface,
         patent_table_name: str,
         include_referential: bool = True,
+        array_columns: bool = False,
+        hash_columns: bool = False,
     ):
-    write_patent_to_db(patents, patent_table_name, db=push_to)
+    write_patent_to_db(
+        patents, patent_table_name, db=push_to, array_columns=array_columns,
+        hash_columns=hash_columns,
+    )
     if include_referential:
+        # uspto_publication_number references the patents table, skip the
+        # patents which were not stored (older than the stored publication)
+        stored = get_stored_publication_numbers(
+            [uspto_patent["publication_number"] for uspto_patent in patents],
+            patent_table_name,
+            db=push_to,
+        )
         for uspto_patent in patents:
+            if uspto_patent["publication_number"] not in stored:
+                continue
             write_referential_documents_to_db(
                 uspto_patent["referential_documents"], db=push_to
             )
 
 
+def push_to_sqlite(
+        patents: list[dict],
+        push_to: SQLiteDBInterface,
+        include_referential: bool = True,
+    ):
+    """
+    Upserts patents into a local SQLite database, with the same tables and
+    upsert semantics as `push_to_db`. Dates are stored as 'YYYY-MM-DD' so
+    SQLite's date functions can be used on them.
+    """
+    db_cursor = push_to.obtain_db_cursor()
+    current_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def get_data_for_column(data, column):
+        value = get_patent_column_value(data, column, current_time)
+        if column in ["publication_date", "grant_date", "application_date"] \
+                and value and len(value) == 8:
+            value = f"{value[:4]}-{value[4:6]}-{value[6:]}"
+        return value
+
+    columns = PATENT_COLUMNS
+    conflict_columns = ["application_number", "patent_office"]
+    updateable_cols = [
+        column for column in columns
+        if column not in conflict_columns and column != "created_at"
+    ]
+    db_cursor.executemany(
+        f"""INSERT INTO {push_to.patent_table_name} ({", ".join(columns)})
+                VALUES ({", ".join(["?"] * len(columns))})
+                ON CONFLICT ({", ".join(conflict_columns)}) DO UPDATE
+                SET {", ".join(f"{col} = excluded.{col}" for col in updateable_cols)}
+                WHERE excluded.publication_date > {push_to.patent_table_name}.publication_date""",
+        [
+            [ get_data_for_column(data, column) for column in columns ]
+                for data in patents
+        ]
+    )
+    n_rows = len(patents)
+
+    if include_referential:
+        columns = REFERENTIAL_DOCUMENT_COLUMNS
+        document_rows = [
+            [
+                _jsonify_dicts(get_referential_document_column_value(data, column, current_time))
+                    for column in columns
+            ]
+            for uspto_patent in patents
+                for data in uspto_patent["referential_documents"]
+        ]
+        db_cursor.executemany(
+            f"""INSERT OR IGNORE INTO uspto_referential_documents ({", ".join(columns)})
+                    VALUES ({", ".join(["?"] * len(columns))})""",
+            document_rows
+        )
+        n_rows += len(document_rows)
+
+    push_to.record_rows(n_rows)
+
+
+def push_to_parquet(patents: list[dict], push_to: ParquetInterface):
+    push_to.write_patents(patents)
+
+
 def get_dump_function(push_to, *args, **kwargs):
     if isinstance(push_to, str) and push_to.endswith(".jsonl"):
         return lambda x: push_to_jsonl(x, push_to)
     elif isinstance(push_to, PGDBInterface):
         return lambda x: push_to_db(x, push_to, *args, **kwargs)
+    elif isinstance(push_to, SQLiteDBInterface):
+        return lambda x: push_to_sqlite(x, push_to, *args, **kwargs)
+    elif isinstance(push_to, ParquetInterface):
+        return lambda x: push_to_parquet(x, push_to)
     else:
         push_to_error = (
             f"push_to: `{str(push_to)}` is not valid."
-            " must be a str ending in 'jsonl' or a PGDBInterface."
+            " must be a str ending in 'jsonl', a PGDBInterface,"
+            " a SQLiteDBInterface or a ParquetInterface."
         )
         logger.error(push_to_error)
         raise ValueError(push_to_error)
 
 
 if __name__ == "__main__":
-    _arg_filenames = []
-    if len(sys.argv) > 1:
-        _arg_filenames = sys.argv[1:]
-
-    _db_config_file = "config/postgres.tsv"
-    _db = PGDBInterface(config_file=_db_config_file)
-    _db.silent_logging = True
-    _push_to = _db
-    _patent_table_name = "uspto_patents"
-
-    _push_to_func = get_dump_function(
-        _push_to,
-        patent_table_name=_patent_table_name,
-        include_referential=True
-    )
-
-    load_local_files(
-        dirpath_list=_arg_filenames,
-        push_to_func=_push_to_func,
-        batch_size=50,
-        limit_per_file=None,
-        keep_log=False,
-    )
+    # kept for `python parse_uspto_xml/parse_patent.py <files>`, see cli.py
+    from parse_uspto_xml.cli import main
+    main()
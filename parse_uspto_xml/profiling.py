@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import random
+import time
+
+from parse_uspto_xml import setup_loggers
+
+
+# setup loggers
+logger = setup_loggers.setup_file_logger(__file__)
+
+# (upper bound in bytes, name) of the document size buckets
+SIZE_BUCKETS = [
+    (64 * 1024, "<64KB"),
+    (256 * 1024, "64KB-256KB"),
+    (1024 * 1024, "256KB-1MB"),
+    (4 * 1024 * 1024, "1MB-4MB"),
+    (float("inf"), ">=4MB"),
+]
+
+
+def get_size_bucket(size: int) -> str:
+    for upper_bound, name in SIZE_BUCKETS:
+        if size < upper_bound:
+            return name
+
+
+class DocumentTimer:
+    """Times the sections of one document, each `lap` ends a section."""
+
+    def __init__(self, size: int, profile=None):
+        self.size = size
+        self.profile = profile
+        self.sections = {}
+        self._last = time.perf_counter()
+
+    def lap(self, section: str):
+        now = time.perf_counter()
+        self.sections[section] = self.sections.get(section, 0.0) + now - self._last
+        self._last = now
+
+
+class _NullTimer:
+    """Stand-in for `DocumentTimer` when profiling is off."""
+
+    def lap(self, section: str):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class _ExportedStats:
+    """Raw `pstats.Stats.stats` in the form `pstats.Stats` can load."""
+
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class SectionProfiler:
+    """
+    Opt-in profiler for `load_batch_from_data` / `parse_uspto_file`.
+
+    Aggregates the time spent in each section (soup, related documents,
+    references, priority claims, classifications, parties, abstract,
+    description, claims) for the run and per document size bucket. A
+    `sample_rate` fraction of the documents is also run under cProfile,
+    the combined stats are written to `pstats_file` by `dump_stats`.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, pstats_file: str | None = None,
+                 seed: int | None = None):
+        self.sample_rate = sample_rate
+        self.pstats_file = pstats_file
+        self.documents = 0
+        self.sampled_documents = 0
+        # section -> [count, seconds]
+        self.sections = {}
+        # bucket -> {"documents": int, "sections": {section -> [count, seconds]}}
+        self.buckets = {}
+        self.stats = None
+        self._random = random.Random(seed)
+
+    def start_document(self, size: int) -> DocumentTimer:
+        profile = None
+        if self.sample_rate and self._random.random() < self.sample_rate:
+            import cProfile
+            profile = cProfile.Profile()
+            profile.enable()
+        return DocumentTimer(size, profile)
+
+    def finish_document(self, timer: DocumentTimer, skipped: bool = False):
+        """Adds the timings of a document, unless it was `skipped`."""
+        if timer.profile is not None:
+            timer.profile.disable()
+            if not skipped:
+                import pstats
+                self.sampled_documents += 1
+                if self.stats is None:
+                    self.stats = pstats.Stats(timer.profile)
+                else:
+                    self.stats.add(timer.profile)
+        if skipped:
+            return
+
+        self.documents += 1
+        bucket = self.buckets.setdefault(
+            get_size_bucket(timer.size), {"documents": 0, "sections": {}}
+        )
+        bucket["documents"] += 1
+        for section, seconds in timer.sections.items():
+            for totals in [self.sections, bucket["sections"]]:
+                count_seconds = totals.setdefault(section, [0, 0.0])
+                count_seconds[0] += 1
+                count_seconds[1] += seconds
+
+    def export(self) -> dict:
+        """Picklable copy of the timings, e.g. to send from a worker process."""
+        return {
+            "documents": self.documents,
+            "sampled_documents": self.sampled_documents,
+            "sections": self.sections,
+            "buckets": self.buckets,
+            "pstats": self.stats.stats if self.stats is not None else None,
+        }
+
+    def merge(self, exported: dict):
+        """Adds the timings exported (see `export`) by another profiler."""
+        self.documents += exported["documents"]
+        self.sampled_documents += exported["sampled_documents"]
+        for name, other_bucket in exported["buckets"].items():
+            bucket = self.buckets.setdefault(name, {"documents": 0, "sections": {}})
+            bucket["documents"] += other_bucket["documents"]
+        for totals, other_totals in [(self.sections, exported["sections"])] + [
+            (self.buckets[name]["sections"], other_bucket["sections"])
+            for name, other_bucket in exported["buckets"].items()
+        ]:
+            for section, (count, seconds) in other_totals.items():
+                count_seconds = totals.setdefault(section, [0, 0.0])
+                count_seconds[0] += count
+                count_seconds[1] += seconds
+        if exported["pstats"]:
+            import pstats
+            stats = _ExportedStats(exported["pstats"])
+            if self.stats is None:
+                self.stats = pstats.Stats(stats)
+            else:
+                self.stats.add(stats)
+
+    def summary(self) -> dict:
+        """Returns the aggregated timings as a json serializable dict."""
+        def format_sections(sections):
+            return {
+                section: {
+                    "count": count,
+                    "total_seconds": round(seconds, 6),
+                    "mean_ms": round(1000 * seconds / count, 3),
+                }
+                for section, (count, seconds) in sorted(
+                    sections.items(), key=lambda item: -item[1][1]
+                )
+            }
+
+        return {
+            "documents": self.documents,
+            "sampled_documents": self.sampled_documents,
+            "sections": format_sections(self.sections),
+            "buckets": {
+                name: {
+                    "documents": self.buckets[name]["documents"],
+                    "sections": format_sections(self.buckets[name]["sections"]),
+                }
+                for _, name in SIZE_BUCKETS if name in self.buckets
+            },
+        }
+
+    def log_summary(self):
+        summary = self.summary()
+        total_seconds = sum(seconds for _, seconds in self.sections.values()) or 1.0
+        logger.info(f"Profiled {summary['documents']} documents")
+        for section, timing in summary["sections"].items():
+            logger.info(
+                f"{section:>20}: {timing['total_seconds']:10.3f}s "
+                f"({100 * timing['total_seconds'] / total_seconds:5.1f}%) "
+                f"{timing['mean_ms']:9.3f}ms/doc"
+            )
+        for name, bucket in summary["buckets"].items():
+            per_document_ms = sum(
+                timing["total_seconds"] for timing in bucket["sections"].values()
+            ) * 1000 / bucket["documents"]
+            logger.info(
+                f"{name:>20}: {bucket['documents']} documents, {per_document_ms:.3f}ms/doc"
+            )
+
+    def dump_stats(self, filename: str | None = None):
+        """Writes the cProfile stats of the sampled documents (see `pstats`)."""
+        filename = filename or self.pstats_file
+        if self.stats is None or filename is None:
+            return
+        self.stats.dump_stats(filename)
+        logger.info(f"cProfile stats of {self.sampled_documents} documents: {filename}")
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import datetime
+import glob
+import gzip
+import hashlib
+import json
+import os
+import traceback
+from typing import Callable
+
+from parse_uspto_xml import setup_loggers
+from parse_uspto_xml.parse_patent import load_batch_from_data
+from parse_uspto_xml.state_file import write_json
+
+
+# setup loggers
+logger = setup_loggers.setup_file_logger(__file__)
+
+
+class QuarantineSink:
+    """
+    Keeps the raw documents which failed to parse, so they can be triaged
+    and replayed (see `replay_quarantine`) without re-reading their source
+    files.
+
+    Each document is stored in `dirpath` as `<id>.xml.gz` with a `<id>.json`
+    record of its source file, byte offset, error and traceback, and
+    whether it was parsed from its bytes or unescaped first (see
+    `load_batch_from_data`), so it is replayed the same way. The id is
+    derived from the source file and offset, so quarantining the same
+    document again updates its record, and several processes can share
+    a directory.
+    """
+
+    def __init__(self, dirpath: str = "quarantine"):
+        self.dirpath = dirpath
+        os.makedirs(dirpath, exist_ok=True)
+
+    def _paths(self, record_id: str) -> tuple[str, str]:
+        base = os.path.join(self.dirpath, record_id)
+        return base + ".xml.gz", base + ".json"
+
+    def add(
+            self,
+            raw_document: str | bytes,
+            source_file: str | None,
+            byte_offset: int | None,
+            title: str | None,
+            error: Exception,
+            unescape: bool = False,
+        ) -> str:
+        """Stores a document which failed to parse, returns its id."""
+        if source_file is not None and byte_offset is not None:
+            key = f"{os.path.abspath(source_file)}:{byte_offset}"
+        else:
+            key = raw_document
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+        record_id = hashlib.sha1(key).hexdigest()[:16]
+        document_path, record_path = self._paths(record_id)
+
+        attempts = 0
+        if os.path.exists(record_path):
+            with open(record_path, "r") as fp:
+                attempts = json.load(fp).get("attempts", 0)
+
+        bytes_pipeline = isinstance(raw_document, bytes)
+        if not bytes_pipeline:
+            raw_document = raw_document.encode("utf-8")
+        with gzip.open(document_path, "wb") as fp:
+            fp.write(raw_document)
+        record = {
+            "id": record_id,
+            "source_file": source_file,
+            "byte_offset": byte_offset,
+            "bytes_pipeline": bytes_pipeline,
+            "unescape": unescape,
+            "title": title,
+            "error": repr(error),
+            "traceback": "".join(
+                traceback.format_exception(type(error), error, error.__traceback__)
+            ),
+            "attempts": attempts + 1,
+            "quarantined_at": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        write_json(record_path, record)
+        return record_id
+
+    def records(self) -> list[dict]:
+        """Returns the quarantined records, oldest first."""
+        records = []
+        for record_path in glob.glob(os.path.join(self.dirpath, "*.json")):
+            with open(record_path, "r") as fp:
+                records.append(json.load(fp))
+        return sorted(records, key=lambda record: record["quarantined_at"])
+
+    def read_raw_document(self, record: dict) -> bytes:
+        with gzip.open(self._paths(record["id"])[0], "rb") as fp:
+            return fp.read()
+
+    def read_document(self, record: dict) -> str:
+        return self.read_raw_document(record).decode("utf-8", errors="replace")
+
+    def remove(self, record: dict):
+        for path in self._paths(record["id"]):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def replay_quarantine(
+        quarantine: QuarantineSink,
+        push_to_func: Callable,
+        batch_size: int = 50,
+        keep_log: bool = False,
+    ):
+    """
+    Re-parses the quarantined documents, e.g. after a parser fix. Documents
+    which now parse are pushed and removed from the quarantine, the others
+    have their error and traceback updated.
+    """
+    count = 0
+    success_count = 0
+    records = quarantine.records()
+    logger.info(f"Replaying {len(records)} quarantined documents")
+    for i in range(0, len(records), batch_size):
+        patents = []
+        parsed_records = []
+        for record in records[i : i + batch_size]:
+            # parsed as they were loaded, from their bytes or their text,
+            # unescaped or not (records without the flag come from load_local_files)
+            if record.get("bytes_pipeline"):
+                document = quarantine.read_raw_document(record)
+            else:
+                document = quarantine.read_document(record)
+            # replayed one by one to know which of them parsed
+            batch_count, batch_success_count, batch_patents, _ = load_batch_from_data(
+                [document],
+                keep_log,
+                unescape=record.get("unescape", True),
+                quarantine=quarantine,
+                source_file=record["source_file"],
+                byte_offsets=[record["byte_offset"]],
+            )
+            count += batch_count
+            if batch_success_count:
+                patents += batch_patents
+                parsed_records.append(record)
+
+        if patents:
+            push_to_func(patents)
+            for record in parsed_records:
+                quarantine.remove(record)
+            success_count += len(parsed_records)
+
+    logger.info(f"Success Count: {success_count}")
+    logger.info(f"Error Count: {count - success_count}")
+    return count, success_count
+
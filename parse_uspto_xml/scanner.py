@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import concurrent.futures
+import os
+import time
+
+from parse_uspto_xml import setup_loggers
+
+
+# setup loggers
+logger = setup_loggers.setup_file_logger(__file__)
+
+BULK_FILE_EXTENSIONS = (".xml", ".zip")
+
+
+def _scan_directory(dirpath: str, extensions: tuple) -> tuple[list, list]:
+    """Returns the (path, size) of the files and the subdirectories of `dirpath`."""
+    files = []
+    subdirectories = []
+    with os.scandir(dirpath) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                subdirectories.append(entry.path)
+            elif entry.name.endswith(extensions):
+                files.append((entry.path, entry.stat().st_size))
+    return files, subdirectories
+
+
+def _is_extracted_archive(path: str) -> bool:
+    """A `.zip` already extracted in place, next to its `.xml` (see README Step 2)."""
+    return path.endswith(".zip") and os.path.exists(path[:-len(".zip")] + ".xml")
+
+
+def scan_files(
+        dirpath_list: list | str,
+        extensions: tuple = BULK_FILE_EXTENSIONS,
+        max_workers: int = 8,
+    ) -> list[tuple[str, int]]:
+    """
+    Lists the (path, size) of the files of `dirpath_list` with one of the
+    `extensions`, recursing into directories.
+
+    Directories are scanned with `os.scandir` by a pool of `max_workers`
+    threads, which mostly helps on network filesystems. Files listed in
+    `dirpath_list` are kept in their order, the files of a directory are
+    sorted by path. A `.zip` whose extracted `.xml` sits next to it is
+    skipped, so its documents are not loaded twice.
+    """
+    if isinstance(dirpath_list, str):
+        dirpath_list = [dirpath_list]
+
+    scanned = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        for dirpath in dirpath_list:
+            if not os.path.isdir(dirpath):
+                if dirpath.endswith(extensions):
+                    scanned.append((dirpath, os.path.getsize(dirpath)))
+                continue
+
+            dir_files = []
+            pending = {executor.submit(_scan_directory, dirpath, extensions)}
+            while pending:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    files, subdirectories = future.result()
+                    dir_files += files
+                    pending |= {
+                        executor.submit(_scan_directory, subdirectory, extensions)
+                        for subdirectory in subdirectories
+                    }
+            scanned += sorted(dir_files)
+
+    if ".xml" not in extensions:
+        return scanned
+    files = []
+    for path, size in scanned:
+        if _is_extracted_archive(path):
+            logger.info(f"Skipping extracted archive: {path}")
+            continue
+        files.append((path, size))
+    return files
+
+
+def format_bytes(n_bytes: float) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(n_bytes) < 1024:
+            return f"{n_bytes:.1f}{unit}"
+        n_bytes /= 1024
+    return f"{n_bytes:.1f}TB"
+
+
+class ByteProgress:
+    """Logs the bytes loaded out of `total_bytes`, with the rate and ETA."""
+
+    def __init__(self, total_bytes: int, log_interval: float = 30.0):
+        self.total_bytes = total_bytes
+        self.log_interval = log_interval
+        self.done_bytes = 0
+        self._start = time.perf_counter()
+        self._last_log = self._start
+
+    def update(self, done_bytes: float, force: bool = False):
+        """Sets the bytes loaded so far, logged at most every `log_interval` seconds."""
+        self.done_bytes = done_bytes
+        now = time.perf_counter()
+        if not force and now - self._last_log < self.log_interval:
+            return
+        self._last_log = now
+
+        elapsed = now - self._start
+        rate = done_bytes / elapsed if elapsed else 0.0
+        eta = "unknown"
+        if rate:
+            remaining = max(self.total_bytes - done_bytes, 0) / rate
+            eta = f"{int(remaining // 3600)}:{int(remaining % 3600 // 60):02d}:{int(remaining % 60):02d}"
+        percent = 100 * done_bytes / self.total_bytes if self.total_bytes else 100.0
+        logger.info(
+            f"Progress: {format_bytes(done_bytes)} / {format_bytes(self.total_bytes)}"
+            f" ({percent:.1f}%), {format_bytes(rate)}/s, ETA {eta}"
+        )
@@ -9,14 +9,27 @@ from pathlib import Path
 _logFormatter = logging.Formatter("%(asctime)s [%(threadName)-12.12s] [%(levelname)-5.5s]  %(message)s")
 
 
+class _DelayedFileHandler(logging.FileHandler):
+    """FileHandler which only creates its directory and file on the first record."""
+
+    def _open(self):
+        Path(os.path.dirname(self.baseFilename)).mkdir(parents=True, exist_ok=True)
+        return super()._open()
+
+
 def create_file_handler(log_name):
-    """creates a file logger"""
+    """
+    creates a file logger
+
+    The log file (and `logs/` directory) is only created once something is
+    logged, so importing a module or starting a worker process has no
+    file system side effects.
+    """
     log_dirpath = os.getcwd()
     log_filepath = os.path.join(
         log_dirpath,  "logs", os.path.basename(log_name) + ".log"
     )
-    Path(os.path.dirname(log_filepath)).mkdir(parents=True, exist_ok=True)
-    file_handler = logging.FileHandler(filename=log_filepath)
+    file_handler = _DelayedFileHandler(filename=log_filepath, delay=True)
     file_handler.setFormatter(_logFormatter)
     return file_handler
 
@@ -27,7 +40,7 @@ def setup_root_logger(level: int = logging.INFO, include_file_logger: bool = Fal
 
     # don't setup root again if already setup.
     for handler in root_logger.handlers:
-        if handler.stream == sys.stdout:
+        if getattr(handler, "stream", None) == sys.stdout:
             return
 
     handler = logging.StreamHandler(sys.stdout)
@@ -47,8 +60,14 @@ def set_root_logger_level(level: int = logging.INFO):
 
 
 def setup_file_logger(filename: str, level: int | None = None) -> logging.Logger:
-    """Sets up file logger for an individual file."""
-    level = logging.getLogger().level
+    """
+    Sets up file logger for an individual file.
+
+    Unless a `level` is given, the logger follows the root logger's level,
+    even if the root logger is only setup after this module is imported.
+    """
+    if level is None:
+        level = logging.NOTSET
 
     file_handler = create_file_handler(filename)
     logger = logging.getLogger(filename)
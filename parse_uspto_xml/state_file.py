@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+import json
+import os
+
+
+def read_state(filename: str | None) -> dict:
+    """Reads the loaded `files` recorded by `--resume` / `--sync`, empty if none yet."""
+    if filename is None or not os.path.exists(filename):
+        return {"files": {}}
+    with open(filename, "r") as fp:
+        return json.load(fp)
+
+
+def write_json(filename: str, data: dict):
+    # write then rename, so an interrupted run never leaves a broken file
+    with open(filename + ".tmp", "w") as fp:
+        json.dump(data, fp, indent=2)
+    os.replace(filename + ".tmp", filename)
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import datetime
+import hashlib
+import os
+import re
+from typing import Callable
+
+from parse_uspto_xml import setup_loggers
+from parse_uspto_xml.parse_patent import get_push_errors, load_local_files
+from parse_uspto_xml.scanner import scan_files
+from parse_uspto_xml.state_file import read_state, write_json
+
+
+# setup loggers
+logger = setup_loggers.setup_file_logger(__file__)
+
+# weekly bulk files are named after their publication date, e.g.
+# ipg200102.xml (grants) or ipa200109.zip (applications)
+_WEEKLY_FILENAME_PATTERN = re.compile(r"^i?p[ag](\d{2})(\d{2})(\d{2})")
+
+
+def get_file_date(filename: str, mtime: float | None = None) -> datetime.date:
+    """Publication date of a weekly bulk file, from its name or else its mtime."""
+    match = _WEEKLY_FILENAME_PATTERN.match(os.path.basename(filename))
+    if match is not None:
+        year, month, day = (int(value) for value in match.groups())
+        try:
+            return datetime.date(2000 + year, month, day)
+        except ValueError:
+            pass
+    if mtime is None:
+        mtime = os.stat(filename).st_mtime
+    return datetime.date.fromtimestamp(mtime)
+
+
+def get_file_checksum(filename: str, chunk_size: int = 1 << 24) -> str:
+    sha256 = hashlib.sha256()
+    with open(filename, "rb") as fp:
+        while True:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                break
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def find_files_to_sync(dirpath_list: list | str, state: dict) -> list[dict]:
+    """
+    Returns the bulk files of `dirpath_list` which are not in the sync
+    `state` or changed since they were loaded, oldest week first.
+
+    Only the files whose size or mtime differ from the `state` are
+    checksummed, a file whose content did not change (e.g. copied again
+    by the mirror) is not loaded again, only its mtime is updated.
+    """
+    files = []
+    for filename, _ in scan_files(dirpath_list):
+        stat = os.stat(filename)
+        synced = state["files"].get(os.path.abspath(filename))
+        if (
+                synced is not None
+                and synced["size"] == stat.st_size
+                and synced["mtime"] == stat.st_mtime
+            ):
+            continue
+
+        checksum = get_file_checksum(filename)
+        if synced is not None and synced["sha256"] == checksum:
+            synced["mtime"] = stat.st_mtime
+            continue
+
+        files.append({
+            "filename": filename,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": checksum,
+            "date": get_file_date(filename, stat.st_mtime),
+        })
+
+    # in publication order, so the newer documents are upserted last
+    return sorted(files, key=lambda file: (file["date"], file["filename"]))
+
+
+def sync_local_files(
+        dirpath_list: list | str,
+        push_to_func: Callable,
+        state_file: str = "sync_state.json",
+        on_file_loaded: Callable | None = None,
+        **kwargs
+    ):
+    """
+    Loads only the new or changed bulk files of a local mirror (see
+    `find_files_to_sync`) with `load_local_files`, and records each loaded
+    file in the `state_file`. Files with batches which failed to push are
+    not recorded, they are loaded again by the next sync. Other `kwargs` are
+    passed to `load_local_files`, except `limit_per_file`: partly loaded
+    files would be recorded as synced.
+    """
+    if kwargs.get("limit_per_file"):
+        raise ValueError("`limit_per_file` cannot be used to sync files.")
+    state = read_state(state_file)
+    files = find_files_to_sync(dirpath_list, state)
+    # mtimes updated for unchanged files
+    write_json(state_file, state)
+    logger.info(f"{len(files)} new or changed files to sync")
+    if not files:
+        return 0, 0, []
+
+    files_by_name = {file["filename"]: file for file in files}
+
+    def record_loaded_file(filename, count, success_count, errors):
+        push_errors = get_push_errors(errors)
+        if push_errors:
+            logger.error(
+                f"{len(push_errors)} batches of {filename} failed to push,"
+                " it is not recorded as synced"
+            )
+        else:
+            file = files_by_name[filename]
+            state["files"][os.path.abspath(filename)] = {
+                "size": file["size"],
+                "mtime": file["mtime"],
+                "sha256": file["sha256"],
+                "date": file["date"].isoformat(),
+                "loaded_at": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                "documents": count,
+                "parsed": success_count,
+            }
+            write_json(state_file, state)
+        if on_file_loaded is not None:
+            on_file_loaded(filename, count, success_count, errors)
+
+    return load_local_files(
+        [file["filename"] for file in files],
+        push_to_func,
+        on_file_loaded=record_loaded_file,
+        **kwargs
+    )
+
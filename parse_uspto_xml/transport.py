@@ -0,0 +1,237 @@
+"""
+Zero-copy hand-off of raw documents to worker processes.
+
+Instead of pickling the XML of every document to the workers, the reader
+locates the documents in a shared buffer and sends (offset, length)
+spans only. Workers map the same buffer and decode their documents from
+it directly:
+
+* `MmapSource` - an uncompressed `.xml` file, memory mapped read-only.
+  Without a pool, a `.zip` is decompressed to a temporary file mapped the
+  same way.
+* `SharedMemorySource` - decompressed data (e.g. from a `.zip`) placed
+  in `multiprocessing.shared_memory`, used when a pool shares it.
+
+Both are small picklable descriptors, `buffer()` maps the data in the
+calling process (once per process, the mapping is cached) and returns a
+view of it, to be released by the caller.
+"""
+from __future__ import annotations
+
+import errno
+import mmap
+import os
+import shutil
+import tempfile
+import zipfile
+
+from parse_uspto_xml import setup_loggers
+
+
+# setup loggers
+logger = setup_loggers.setup_file_logger(__file__)
+
+# every document in a USPTO bulk file begins with this declaration
+XML_DECLARATION_BYTES = b"<?xml version=\"1.0\" encoding=\"UTF-8\"?>"
+
+# backs multiprocessing.shared_memory on linux, its pages are only
+# allocated when written (a full /dev/shm then kills the writer with SIGBUS)
+SHARED_MEMORY_DIR = "/dev/shm"
+
+# key -> mmap / SharedMemory handle of the source mapped by this process
+_mapped = {}
+
+
+def _map_once(key, open_func):
+    """Maps a source once per process, unmapping the previous one."""
+    if key not in _mapped:
+        release_mapped()
+        _mapped[key] = open_func()
+    return _mapped[key]
+
+
+def release_mapped():
+    """Unmaps the source mapped by this process, if any."""
+    for handle in _mapped.values():
+        handle.close()
+    _mapped.clear()
+
+
+def _xml_members(zip_file: zipfile.ZipFile) -> list[zipfile.ZipInfo]:
+    return [info for info in zip_file.infolist() if info.filename.endswith(".xml")]
+
+
+class MmapSource:
+    """An uncompressed XML file, memory mapped by each process using it."""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._temporary = False
+
+    @classmethod
+    def from_zip(cls, filename: str, chunk_size: int = 1 << 24) -> MmapSource:
+        """
+        Decompresses the `.xml` members of a `.zip` to a temporary file
+        (in `tempfile.gettempdir()`), deleted when the source is closed.
+        """
+        fd, temp_filename = tempfile.mkstemp(suffix=".xml")
+        source = cls(temp_filename)
+        source._temporary = True
+        try:
+            with os.fdopen(fd, "wb") as temp_file, zipfile.ZipFile(filename) as zip_file:
+                for info in _xml_members(zip_file):
+                    with zip_file.open(info) as fp:
+                        shutil.copyfileobj(fp, temp_file, chunk_size)
+        except BaseException:
+            source.close()
+            raise
+        return source
+
+    def __getstate__(self):
+        # the temporary file is deleted by the process which created it
+        return {"filename": self.filename, "_temporary": False}
+
+    def _open(self):
+        with open(self.filename, "rb") as fp:
+            return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def buffer(self) -> memoryview:
+        # an empty file cannot be mapped, it has no documents
+        if os.path.getsize(self.filename) == 0:
+            return memoryview(b"")
+        return memoryview(_map_once(("mmap", self.filename), self._open))
+
+    def spans(self) -> list[tuple[int, int]]:
+        if os.path.getsize(self.filename) == 0:
+            return []
+        return find_document_spans(_map_once(("mmap", self.filename), self._open))
+
+    def close(self):
+        release_mapped()
+        if self._temporary:
+            os.remove(self.filename)
+            self._temporary = False
+
+
+class SharedMemorySource:
+    """Data copied once into shared memory, attached by each process using it."""
+
+    def __init__(self, name: str, size: int, document_spans=None):
+        self.name = name
+        self.size = size
+        self.document_spans = document_spans
+        self._owner = None
+
+    @classmethod
+    def from_zip(cls, filename: str, chunk_size: int = 1 << 24) -> SharedMemorySource:
+        """
+        Decompresses the `.xml` members of a `.zip` straight into shared
+        memory. Raises OSError if they do not fit in `SHARED_MEMORY_DIR`.
+        """
+        from multiprocessing import shared_memory
+        with zipfile.ZipFile(filename) as zip_file:
+            members = _xml_members(zip_file)
+            size = sum(info.file_size for info in members)
+            # the memory is not allocated up front, check it fits instead
+            # of running out of it while writing
+            if os.path.isdir(SHARED_MEMORY_DIR):
+                stat = os.statvfs(SHARED_MEMORY_DIR)
+                if size > stat.f_bavail * stat.f_frsize:
+                    raise OSError(
+                        errno.ENOSPC,
+                        f"{filename} decompresses to {size} bytes, more than "
+                        f"is free in {SHARED_MEMORY_DIR}",
+                    )
+            owner = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            source = cls(owner.name, size)
+            source._owner = owner
+            try:
+                offset = 0
+                for info in members:
+                    with zip_file.open(info) as fp:
+                        while True:
+                            chunk = fp.read(chunk_size)
+                            if not chunk:
+                                break
+                            owner.buf[offset : offset + len(chunk)] = chunk
+                            offset += len(chunk)
+                with source.buffer() as buffer:
+                    source.document_spans = find_document_spans(buffer)
+            except BaseException:
+                source.close()
+                raise
+        return source
+
+    def __getstate__(self):
+        # only the name is sent, the owner handle and spans stay with the
+        # process which created the memory
+        return {"name": self.name, "size": self.size, "document_spans": None, "_owner": None}
+
+    def _open(self):
+        from multiprocessing import shared_memory
+        return shared_memory.SharedMemory(name=self.name)
+
+    def buffer(self) -> memoryview:
+        handle = self._owner
+        if handle is None:
+            handle = _map_once(("shm", self.name), self._open)
+        return handle.buf[:self.size]
+
+    def spans(self) -> list[tuple[int, int]]:
+        return self.document_spans
+
+    def close(self):
+        """Frees the shared memory, called by the process which created it."""
+        release_mapped()
+        if self._owner is not None:
+            self._owner.close()
+            self._owner.unlink()
+            self._owner = None
+
+
+def open_source(filename: str, shared: bool = False) -> MmapSource | SharedMemorySource:
+    """
+    Returns the source of a `.xml` file (memory mapped) or of the `.xml`
+    files in a `.zip`. A `.zip` is decompressed into shared memory if it is
+    `shared` with a pool and fits there, otherwise to a temporary file
+    which is memory mapped.
+    """
+    if not filename.endswith(".zip"):
+        return MmapSource(filename)
+    if shared:
+        try:
+            return SharedMemorySource.from_zip(filename)
+        except OSError as e:
+            logger.warning(f"{e}, decompressing to a temporary file instead")
+    return MmapSource.from_zip(filename)
+
+
+def _find_declarations(buffer, chunk_size: int = 1 << 24) -> list[int]:
+    """Offsets of the XML declarations in `buffer`, searched chunk by chunk."""
+    offsets = []
+    overlap = len(XML_DECLARATION_BYTES) - 1
+    size = len(buffer)
+    for start in range(0, size, chunk_size):
+        chunk = bytes(buffer[start : start + chunk_size + overlap])
+        position = chunk.find(XML_DECLARATION_BYTES)
+        # declarations starting in the overlap are found in the next chunk
+        while position != -1 and position < chunk_size:
+            offsets.append(start + position)
+            position = chunk.find(XML_DECLARATION_BYTES, position + len(XML_DECLARATION_BYTES))
+    return offsets
+
+
+def find_document_spans(buffer, chunk_size: int = 1 << 24) -> list[tuple[int, int]]:
+    """
+    Returns the (offset, length) of each document in `buffer` (bytes, mmap
+    or memoryview), the same documents as splitting the decoded text on the
+    XML declaration.
+    """
+    offsets = _find_declarations(buffer, chunk_size)
+    starts = [0] + [offset + len(XML_DECLARATION_BYTES) for offset in offsets]
+    ends = offsets + [len(buffer)]
+    spans = [(start, end - start) for start, end in zip(starts, ends)]
+    # like str.split, only a leading empty document is dropped
+    if spans and not spans[0][1]:
+        spans = spans[1:]
+    return spans
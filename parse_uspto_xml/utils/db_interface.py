@@ -2,17 +2,9 @@ import os
 import csv
 import ast
 
-# load the psycopg to connect to postgresql
-import psycopg2
-import psycopg2.extras
-from dotenv import load_dotenv
-
 from parse_uspto_xml.setup_loggers import setup_file_logger
 
 
-# load env vars
-load_dotenv()
-
 # setup file logger
 logger = setup_file_logger(__file__)
 
@@ -44,11 +36,17 @@ class PGDBInterface:
                             check environment is not set.
         """
 
+        # imported here so only processes using PostgreSQL pay for them
+        import psycopg2
+        from dotenv import load_dotenv
+
         remote = self.set_remote
 
         # Check if database parameters in environment
         params = {}
         if check_environment:
+            # load env vars
+            load_dotenv()
             if not self.silent_logging:
                 logger.info("\nChecking Environment Parameters for Database\n")
             if 'DATABASE_NAME' in os.environ:
@@ -151,3 +149,190 @@ class PGDBInterface:
         self.conn    = None
 
         logger.info("Disconnected from database")
+
+    def create_search_index(self, patent_table_name="uspto_patents",
+                            search_table_name="uspto_patents_search"):
+        """
+        Creates the full-text search side table and its GIN index.
+
+        Patents to index are marked by a NULL `search_indexed_at` column,
+        which a trigger resets on every insert or update of a patent, so
+        the loads do not need to know about the search index.
+        :param patent_table_name: Table the patents are loaded into.
+        :param search_table_name: Table which holds one precomputed
+                                  tsvector per patent.
+        """
+        self.cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {search_table_name}(
+                application_number VARCHAR,
+                patent_office VARCHAR,
+                publication_number VARCHAR,
+                document tsvector,
+                indexed_at TIMESTAMP without time zone,
+                PRIMARY KEY(application_number, patent_office)
+            );
+            CREATE INDEX IF NOT EXISTS idx_{search_table_name}_document
+                ON {search_table_name} USING GIN (document);
+
+            CREATE OR REPLACE FUNCTION {patent_table_name}_search_pending() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    NEW.search_indexed_at := NULL;
+                -- any update but the one of `update_search_index`
+                ELSIF NEW.search_indexed_at IS NOT DISTINCT FROM OLD.search_indexed_at THEN
+                    NEW.search_indexed_at := NULL;
+                END IF;
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql;
+
+            -- only altered once, ALTER TABLE would wait for the running loads
+            DO $do$
+            BEGIN
+                IF NOT EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                        WHERE table_schema = current_schema()
+                            AND table_name = '{patent_table_name}'
+                            AND column_name = 'search_indexed_at'
+                ) THEN
+                    -- NULL for every patent, all of them are indexed
+                    ALTER TABLE {patent_table_name}
+                        ADD COLUMN search_indexed_at TIMESTAMP without time zone;
+                    -- only holds the patents left to index
+                    CREATE INDEX idx_{patent_table_name}_search_pending
+                        ON {patent_table_name} (application_number, patent_office)
+                        WHERE search_indexed_at IS NULL;
+                    CREATE TRIGGER {patent_table_name}_search_pending
+                        BEFORE INSERT OR UPDATE ON {patent_table_name}
+                        FOR EACH ROW EXECUTE FUNCTION {patent_table_name}_search_pending();
+                END IF;
+            END
+            $do$;
+        """)
+
+    def update_search_index(self, patent_table_name="uspto_patents",
+                            search_table_name="uspto_patents_search",
+                            ts_config="english", batch_size=1000,
+                            max_text_length=500000):
+        """
+        Indexes the patents inserted or updated since the last update.
+        Each batch takes patents with a NULL `search_indexed_at` from the
+        partial index of the pending patents, so a run only reads the new
+        patents, not the whole table. A patent updated while it is indexed
+        is indexed again by the next run.
+        :param ts_config: Text search configuration used to build the
+                          tsvectors.
+        :param batch_size: Number of patents per statement.
+        :param max_text_length: Claims and descriptions are truncated to
+                                this many characters to stay under the
+                                1MB tsvector limit.
+        :return: number of patents indexed
+        """
+        self.create_search_index(patent_table_name, search_table_name)
+
+        total_count = 0
+        while True:
+            # title > abstract > claims > description when ranking
+            self.cursor.execute(f"""
+                WITH batch AS (
+                    UPDATE {patent_table_name} AS p
+                        SET search_indexed_at = NOW()
+                        WHERE (p.application_number, p.patent_office) IN (
+                            SELECT application_number, patent_office
+                                FROM {patent_table_name}
+                                WHERE search_indexed_at IS NULL
+                                LIMIT %(batch_size)s
+                                FOR UPDATE SKIP LOCKED
+                        )
+                        RETURNING p.application_number, p.patent_office,
+                            p.publication_number, p.publication_title, p.abstract,
+                            p.claims, p.description, p.search_indexed_at
+                )
+                INSERT INTO {search_table_name}
+                    (application_number, patent_office, publication_number,
+                     document, indexed_at)
+                SELECT
+                    p.application_number,
+                    p.patent_office,
+                    p.publication_number,
+                    setweight(to_tsvector(%(ts_config)s::regconfig, COALESCE(p.publication_title, '')), 'A')
+                    || setweight(to_tsvector(%(ts_config)s::regconfig, COALESCE(p.abstract, '')), 'B')
+                    || setweight(to_tsvector(%(ts_config)s::regconfig, LEFT(COALESCE(p.claims, ''), %(max_text_length)s)), 'C')
+                    || setweight(to_tsvector(%(ts_config)s::regconfig, LEFT(COALESCE(p.description, ''), %(max_text_length)s)), 'D'),
+                    p.search_indexed_at
+                FROM batch AS p
+                ON CONFLICT (application_number, patent_office) DO UPDATE
+                SET (publication_number, document, indexed_at) =
+                    (EXCLUDED.publication_number, EXCLUDED.document, EXCLUDED.indexed_at)
+            """, {
+                "batch_size": batch_size,
+                "ts_config": ts_config,
+                "max_text_length": max_text_length,
+            })
+            if not self.cursor.rowcount:
+                break
+            total_count += self.cursor.rowcount
+            if not self.silent_logging:
+                logger.info(f"Indexed {total_count} patents for search")
+
+        logger.info(f"Search index updated with {total_count} patents")
+        return total_count
+
+    def search_patents(self, query, limit=10,
+                       patent_table_name="uspto_patents",
+                       search_table_name="uspto_patents_search",
+                       ts_config="english"):
+        """
+        Full-text search over titles, abstracts, claims and descriptions.
+        :param query: Search in web search syntax, e.g.
+                      `"neural network" -image or accelerator`
+        :param limit: Maximum number of patents returned.
+        :return: list of dicts ordered by rank
+        """
+        self.cursor.execute(f"""
+            SELECT p.publication_number, p.publication_title,
+                   p.publication_date, ts_rank(s.document, query) AS rank
+            FROM {search_table_name} AS s
+            JOIN {patent_table_name} AS p
+                ON p.application_number = s.application_number
+                AND p.patent_office = s.patent_office,
+            websearch_to_tsquery(%(ts_config)s::regconfig, %(query)s) AS query
+            WHERE s.document @@ query
+            ORDER BY rank DESC
+            LIMIT %(limit)s
+        """, {"query": query, "limit": limit, "ts_config": ts_config})
+        columns = [column.name for column in self.cursor.description]
+        return [dict(zip(columns, row)) for row in self.cursor.fetchall()]
+
+    def find_patents_by_array_values(self, column, values, match_all=False,
+                                     limit=100,
+                                     patent_table_name="uspto_patents"):
+        """
+        Looks up patents stored with `array_columns=True` by the values of a
+        `text[]` column, e.g. organizations or section_class_subclasses.
+        Uses the GIN index on the column (`&&` / `@>`).
+        :param column: Array column to search, e.g. `sections`.
+        :param values: Values to look for, e.g. `["G06F", "H04L"]`.
+        :param match_all: If set, patents must contain all `values`,
+                          otherwise any of them.
+        :param limit: Maximum number of patents returned.
+        :return: list of dicts
+        """
+        array_columns = {
+            "authors", "organizations", "attorneys", "attorney_organizations",
+            "sections", "section_classes", "section_class_subclasses",
+            "section_class_subclass_groups",
+        }
+        if column not in array_columns:
+            raise ValueError(
+                f"column: `{column}` is not valid. must be one of {sorted(array_columns)}."
+            )
+        operator = "@>" if match_all else "&&"
+        self.cursor.execute(f"""
+            SELECT publication_number, publication_title, publication_date, {column}
+            FROM {patent_table_name}
+            WHERE {column} {operator} %(values)s::text[]
+            LIMIT %(limit)s
+        """, {"values": list(values), "limit": limit})
+        columns = [column.name for column in self.cursor.description]
+        return [dict(zip(columns, row)) for row in self.cursor.fetchall()]
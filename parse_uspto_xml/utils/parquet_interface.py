@@ -0,0 +1,100 @@
+import json
+import os
+
+from parse_uspto_xml.setup_loggers import setup_file_logger
+
+
+# setup file logger
+logger = setup_file_logger(__file__)
+
+_LIST_FIELDS = {
+    "authors", "organizations", "attorneys", "attorney_organizations",
+    "sections", "section_classes", "section_class_subclasses",
+    "section_class_subclass_groups", "abstract", "descriptions", "claims",
+}
+
+# order of the fields of a parsed patent, see `parse_uspto_file`
+PATENT_FIELDS = [
+    "publication_title",
+    "publication_number",
+    "publication_date",
+    "grant_date",
+    "application_number",
+    "application_type",
+    "application_date",
+    "application_status",
+    "patent_office",
+    "authors",
+    "organizations",
+    "attorneys",
+    "attorney_organizations",
+    "referential_documents",
+    "sections",
+    "section_classes",
+    "section_class_subclasses",
+    "section_class_subclass_groups",
+    "abstract",
+    "descriptions",
+    "claims",
+]
+
+
+class ParquetInterface:
+    """
+    Writes parsed patents to a Parquet file, one row group per batch.
+
+    List fields are stored as `list<string>` columns and the referential
+    documents as a JSON string column. Requires `pyarrow`
+    (`pip install parse-uspto-xml[parquet]`).
+    """
+
+    def __init__(self, path="uspto_patents.parquet", fields=None,
+                 compression="zstd", silent_logging=False):
+        try:
+            import pyarrow
+        except ImportError as e:
+            raise ImportError(
+                "The parquet sink requires pyarrow: `pip install pyarrow`"
+            ) from e
+
+        self.path           = path
+        self.fields         = [field for field in PATENT_FIELDS if fields is None or field in fields]
+        self.compression    = compression
+        self.silent_logging = silent_logging
+        self.writer         = None
+        self.schema         = pyarrow.schema([
+            (
+                field,
+                pyarrow.list_(pyarrow.string()) if field in _LIST_FIELDS
+                else pyarrow.string()
+            )
+            for field in self.fields
+        ])
+
+    def write_patents(self, patents):
+        import pyarrow
+        import pyarrow.parquet
+
+        if not patents:
+            return
+        if self.writer is None:
+            if not self.silent_logging:
+                logger.info(f"Writing parquet file: {self.path}")
+            self.writer = pyarrow.parquet.ParquetWriter(
+                self.path, self.schema, compression=self.compression
+            )
+
+        columns = {field: [] for field in self.fields}
+        for patent in patents:
+            for field in self.fields:
+                value = patent.get(field)
+                if field == "referential_documents" and value is not None:
+                    value = json.dumps(value)
+                columns[field].append(value)
+        self.writer.write_table(pyarrow.table(columns, schema=self.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            logger.info(f"Closed parquet file: {os.path.abspath(self.path)}")
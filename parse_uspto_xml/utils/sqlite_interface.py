@@ -0,0 +1,184 @@
+import os
+import sqlite3
+
+from parse_uspto_xml.setup_loggers import setup_file_logger
+
+
+# setup file logger
+logger = setup_file_logger(__file__)
+
+
+class SQLiteDBInterface:
+    """
+    Local, serverless alternative to `PGDBInterface` which stores the same
+    `uspto_patents` and `uspto_referential_documents` tables in a single
+    SQLite file.
+
+    Rows are inserted inside large transactions (committed every
+    `commit_every` rows). Only the unique indexes used for upserts exist
+    during the load, the search indexes (and optional FTS5 index) are
+    built by `finish_load` once everything is inserted.
+    """
+
+    def __init__(self, db_path="uspto_patents.sqlite",
+                 patent_table_name="uspto_patents",
+                 fts=False, commit_every=100000, silent_logging=False):
+
+        self.db_path           = db_path
+        self.patent_table_name = patent_table_name
+        self.fts               = fts
+        self.commit_every      = commit_every
+        self.silent_logging    = silent_logging
+        self.uncommitted_rows  = 0
+
+        self.create_db_connection()
+        self.create_tables()
+
+    def create_db_connection(self):
+        """Opens (or creates) the SQLite file, tuned for bulk loading."""
+        if not self.silent_logging:
+            logger.info(f"Connecting to SQLite database: {self.db_path}")
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute("PRAGMA temp_store = MEMORY")
+        self.conn.execute("PRAGMA cache_size = -262144")  # 256MB
+        self.cursor = self.conn.cursor()
+
+    def create_tables(self):
+        """Creates the tables, with only the indexes needed while loading."""
+        self.cursor.executescript(f"""
+            CREATE TABLE IF NOT EXISTS {self.patent_table_name}(
+                publication_number TEXT,
+                publication_title TEXT,
+                publication_date TEXT,
+                publication_type TEXT,
+                grant_date TEXT,
+                application_number TEXT,
+                application_date TEXT,
+                application_status TEXT,
+                patent_office TEXT,
+                authors TEXT,
+                organizations TEXT,
+                attorneys TEXT,
+                attorney_organizations TEXT,
+                sections TEXT,
+                section_classes TEXT,
+                section_class_subclasses TEXT,
+                section_class_subclass_groups TEXT,
+                abstract TEXT,
+                description TEXT,
+                claims TEXT,
+                created_at TEXT,
+                updated_at TEXT,
+                UNIQUE(application_number, patent_office)
+            );
+
+            CREATE TABLE IF NOT EXISTS uspto_referential_documents(
+                id INTEGER PRIMARY KEY,
+                uspto_publication_number TEXT,
+                reference TEXT,
+                document_type TEXT,
+                cited_by_examiner INTEGER,
+                country TEXT,
+                kind TEXT,
+                metadata TEXT,
+                created_at TEXT,
+                updated_at TEXT
+            );
+
+            CREATE UNIQUE INDEX IF NOT EXISTS patent_reference_constraint_null
+                ON uspto_referential_documents (
+                    uspto_publication_number, COALESCE(reference, ''), document_type,
+                    COALESCE(country, ''), COALESCE(kind, '')
+                );
+        """)
+
+    def obtain_db_connection(self):
+        return self.conn
+
+    def obtain_db_cursor(self):
+        return self.cursor
+
+    def record_rows(self, n_rows):
+        """Counts inserted rows, committing once `commit_every` is reached."""
+        self.uncommitted_rows += n_rows
+        if self.uncommitted_rows >= self.commit_every:
+            self.commit_to_db()
+
+    def commit_to_db(self):
+        if not self.silent_logging:
+            logger.info(f"Committing {self.uncommitted_rows} rows to database")
+        self.conn.commit()
+        self.uncommitted_rows = 0
+
+    def create_indexes(self):
+        """Creates the search indexes, run after the load."""
+        if not self.silent_logging:
+            logger.info("Creating indexes")
+        self.cursor.executescript(f"""
+            CREATE INDEX IF NOT EXISTS idx_publication_number
+                ON {self.patent_table_name} (publication_number);
+            CREATE INDEX IF NOT EXISTS idx_publication_date
+                ON {self.patent_table_name} (publication_date);
+            CREATE INDEX IF NOT EXISTS idx_publication_title
+                ON {self.patent_table_name} (lower(publication_title));
+            CREATE INDEX IF NOT EXISTS reference
+                ON uspto_referential_documents (reference);
+            ANALYZE;
+        """)
+
+    def create_fts_index(self):
+        """(Re)builds an FTS5 index over titles, abstracts, claims and descriptions."""
+        if not self.silent_logging:
+            logger.info("Building FTS5 index")
+        self.cursor.executescript(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {self.patent_table_name}_fts USING fts5(
+                publication_title, abstract, claims, description,
+                content='{self.patent_table_name}', content_rowid='rowid'
+            );
+            INSERT INTO {self.patent_table_name}_fts({self.patent_table_name}_fts)
+                VALUES ('rebuild');
+        """)
+
+    def finish_load(self):
+        """Commits the last transaction and builds the indexes."""
+        self.commit_to_db()
+        self.create_indexes()
+        if self.fts:
+            self.create_fts_index()
+        self.conn.commit()
+
+    def search_patents(self, query, limit=10):
+        """
+        Full-text search using the FTS5 index, see `create_fts_index`.
+        :param query: FTS5 query, e.g. `"neural network" AND accelerator`
+        :param limit: Maximum number of patents returned.
+        :return: list of dicts ordered by rank
+        """
+        # bm25 weights: title > abstract > claims > description
+        self.cursor.execute(f"""
+            SELECT p.publication_number, p.publication_title, p.publication_date,
+                   bm25({self.patent_table_name}_fts, 10.0, 5.0, 2.0, 1.0) AS rank
+            FROM {self.patent_table_name}_fts
+            JOIN {self.patent_table_name} AS p
+                ON p.rowid = {self.patent_table_name}_fts.rowid
+            WHERE {self.patent_table_name}_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        """, (query, limit))
+        columns = [column[0] for column in self.cursor.description]
+        return [dict(zip(columns, row)) for row in self.cursor.fetchall()]
+
+    def close_db_connection(self):
+        self.commit_to_db()
+
+        if not self.silent_logging:
+            logger.info("Closing connection")
+        self.cursor.close()
+        self.conn.close()
+
+        self.cursor = None
+        self.conn   = None
+
+        logger.info(f"Disconnected from database: {os.path.abspath(self.db_path)}")
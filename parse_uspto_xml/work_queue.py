@@ -0,0 +1,340 @@
+from __future__ import annotations
+
+import os
+import socket
+import threading
+import time
+from typing import Callable
+
+import psycopg2.extras
+
+from parse_uspto_xml import setup_loggers
+from parse_uspto_xml.parse_patent import (
+    count_documents_in_file,
+    get_push_errors,
+    load_from_source,
+)
+from parse_uspto_xml.scanner import format_bytes, scan_files
+from parse_uspto_xml.transport import open_source
+from parse_uspto_xml.utils.db_interface import PGDBInterface
+
+
+# setup loggers
+logger = setup_loggers.setup_file_logger(__file__)
+
+QUEUE_TABLE_NAME = "uspto_ingest_queue"
+
+
+def create_queue_table(db: PGDBInterface, queue_table_name: str = QUEUE_TABLE_NAME):
+    """Creates the work queue table (and its indexes) if it does not exist."""
+    db_cursor = db.obtain_db_cursor()
+    db_cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {queue_table_name}(
+            id SERIAL PRIMARY KEY,
+            filename VARCHAR NOT NULL,
+            shard_start INTEGER NOT NULL DEFAULT 0,
+            shard_end INTEGER,
+            status VARCHAR NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker_id VARCHAR,
+            parsed_count INTEGER,
+            error_count INTEGER,
+            last_error TEXT,
+            claimed_at TIMESTAMP without time zone,
+            heartbeat_at TIMESTAMP without time zone,
+            finished_at TIMESTAMP without time zone,
+            created_at TIMESTAMP without time zone DEFAULT NOW(),
+            updated_at TIMESTAMP without time zone DEFAULT NOW()
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS {queue_table_name}_shard_constraint
+            ON {queue_table_name} (filename, shard_start);
+        CREATE INDEX IF NOT EXISTS {queue_table_name}_status
+            ON {queue_table_name} (status, heartbeat_at);
+    """)
+
+
+def enqueue_files(
+        db: PGDBInterface,
+        dirpath_list: list | str,
+        shard_size: int | None = None,
+        queue_table_name: str = QUEUE_TABLE_NAME,
+    ) -> int:
+    """
+    Adds the xml files found in `dirpath_list` to the work queue.
+
+    If `shard_size` is set, each file is split into shards of at most
+    `shard_size` documents so several workers can share one large file.
+    Files must be reachable at the same path from every worker node.
+    Already queued files / shards are left untouched. Tasks are queued
+    (and so claimed) largest first, so the workers finish together.
+    """
+    # (estimated bytes, row)
+    sized_rows = []
+    for filename, size in scan_files(dirpath_list, extensions=(".xml",)):
+        filename = os.path.abspath(filename)
+        if not shard_size:
+            sized_rows.append((size, (filename, 0, None)))
+            continue
+        n_documents = count_documents_in_file(filename)
+        for shard_start in range(0, n_documents, shard_size):
+            shard_end = min(shard_start + shard_size, n_documents)
+            sized_rows.append((
+                size * (shard_end - shard_start) / n_documents,
+                (filename, shard_start, shard_end),
+            ))
+
+    if not sized_rows:
+        return 0
+    sized_rows.sort(key=lambda sized_row: -sized_row[0])
+    rows = [row for _, row in sized_rows]
+    logger.info(
+        f"{len(rows)} tasks, {format_bytes(sum(size for size, _ in sized_rows))} to load"
+    )
+
+    db_cursor = db.obtain_db_cursor()
+    psycopg2.extras.execute_values(
+        db_cursor,
+        f"""INSERT INTO {queue_table_name} ("filename", "shard_start", "shard_end")
+                VALUES
+                    %s
+                ON CONFLICT DO NOTHING""",
+        rows,
+        page_size=len(rows),
+    )
+    logger.info(f"Queued {db_cursor.rowcount} of {len(rows)} tasks")
+    return db_cursor.rowcount
+
+
+def claim_task(
+        db: PGDBInterface,
+        worker_id: str,
+        stale_after: int = 600,
+        max_attempts: int = 3,
+        queue_table_name: str = QUEUE_TABLE_NAME,
+    ) -> dict | None:
+    """
+    Claims the next pending task for `worker_id`.
+
+    Tasks claimed by a worker which has not sent a heartbeat in
+    `stale_after` seconds are considered abandoned and are claimed again
+    until they have been attempted `max_attempts` times. `SKIP LOCKED`
+    lets concurrent workers claim different tasks without blocking.
+    Times come from the database (NOW()) so clock skew between nodes
+    does not matter.
+    """
+    db_cursor = db.obtain_db_cursor()
+
+    # abandoned tasks which ran out of attempts will never be claimed again
+    db_cursor.execute(
+        f"""UPDATE {queue_table_name}
+                SET status = 'failed', updated_at = NOW(),
+                    last_error = COALESCE(last_error, 'abandoned by worker ' || worker_id)
+                WHERE status = 'claimed'
+                    AND heartbeat_at < NOW() - %(stale_after)s * INTERVAL '1 second'
+                    AND attempts >= %(max_attempts)s""",
+        {"stale_after": stale_after, "max_attempts": max_attempts},
+    )
+
+    db_cursor.execute(
+        f"""UPDATE {queue_table_name} AS queue
+                SET status = 'claimed',
+                    worker_id = %(worker_id)s,
+                    attempts = queue.attempts + 1,
+                    claimed_at = NOW(),
+                    heartbeat_at = NOW(),
+                    updated_at = NOW()
+                WHERE queue.id = (
+                    SELECT id FROM {queue_table_name}
+                        WHERE (
+                            status = 'pending'
+                            OR (
+                                status = 'claimed'
+                                AND heartbeat_at < NOW() - %(stale_after)s * INTERVAL '1 second'
+                            )
+                        ) AND attempts < %(max_attempts)s
+                        ORDER BY id
+                        LIMIT 1
+                        FOR UPDATE SKIP LOCKED
+                )
+                RETURNING queue.id, queue.filename, queue.shard_start,
+                    queue.shard_end, queue.attempts""",
+        {
+            "worker_id": worker_id,
+            "stale_after": stale_after,
+            "max_attempts": max_attempts,
+        },
+    )
+    row = db_cursor.fetchone()
+    if row is None:
+        return None
+    return {
+        "id": row[0],
+        "filename": row[1],
+        "shard_start": row[2],
+        "shard_end": row[3],
+        "attempts": row[4],
+    }
+
+
+def heartbeat(
+        db: PGDBInterface,
+        task_id: int,
+        worker_id: str,
+        db_cursor=None,
+        queue_table_name: str = QUEUE_TABLE_NAME,
+    ) -> bool:
+    """Refreshes a claim, returns False if the claim was lost to another worker."""
+    if db_cursor is None:
+        db_cursor = db.obtain_db_cursor()
+    db_cursor.execute(
+        f"""UPDATE {queue_table_name}
+                SET heartbeat_at = NOW()
+                WHERE id = %s AND worker_id = %s AND status = 'claimed'""",
+        (task_id, worker_id),
+    )
+    return db_cursor.rowcount == 1
+
+
+def finish_task(
+        db: PGDBInterface,
+        task_id: int,
+        worker_id: str,
+        parsed_count: int | None = None,
+        error_count: int | None = None,
+        error: str | None = None,
+        max_attempts: int = 3,
+        queue_table_name: str = QUEUE_TABLE_NAME,
+    ):
+    """
+    Marks a claimed task as done, or when `error` is set, returns it to the
+    queue (or marks it failed once it has used up `max_attempts`).
+    """
+    db_cursor = db.obtain_db_cursor()
+    if error is None:
+        db_cursor.execute(
+            f"""UPDATE {queue_table_name}
+                    SET status = 'done', finished_at = NOW(), updated_at = NOW(),
+                        parsed_count = %s, error_count = %s, last_error = NULL
+                    WHERE id = %s AND worker_id = %s""",
+            (parsed_count, error_count, task_id, worker_id),
+        )
+    else:
+        db_cursor.execute(
+            f"""UPDATE {queue_table_name}
+                    SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+                        updated_at = NOW(), last_error = %s
+                    WHERE id = %s AND worker_id = %s""",
+            (max_attempts, error, task_id, worker_id),
+        )
+
+
+def get_queue_status(db: PGDBInterface, queue_table_name: str = QUEUE_TABLE_NAME) -> dict:
+    """Returns the number of tasks in each status."""
+    db_cursor = db.obtain_db_cursor()
+    db_cursor.execute(
+        f"SELECT status, count(*) FROM {queue_table_name} GROUP BY status"
+    )
+    return dict(db_cursor.fetchall())
+
+
+def _heartbeat_loop(db, task_id, worker_id, interval, stop_event, queue_table_name):
+    # separate cursor, the worker's cursor is busy writing patents
+    db_cursor = db.obtain_db_connection().cursor()
+    try:
+        while not stop_event.wait(interval):
+            if not heartbeat(db, task_id, worker_id, db_cursor, queue_table_name):
+                logger.warning(f"Worker {worker_id} lost its claim on task {task_id}")
+                return
+    except Exception as e:
+        logger.error(f"Heartbeat failed for task {task_id}: {e}", exc_info=True)
+    finally:
+        db_cursor.close()
+
+
+def run_worker(
+        db: PGDBInterface,
+        push_to_func: Callable,
+        worker_id: str | None = None,
+        batch_size: int = 50,
+        keep_log: bool = False,
+        stale_after: int = 600,
+        heartbeat_interval: int = 60,
+        max_attempts: int = 3,
+        poll_interval: float | None = None,
+        queue_table_name: str = QUEUE_TABLE_NAME,
+    ):
+    """
+    Claims and loads tasks from the work queue until it is empty.
+
+    If `poll_interval` is set, the worker sleeps and polls for new tasks
+    instead of exiting once the queue is empty. A task with a batch which
+    failed to push is returned to the queue, as if the load had raised.
+    """
+    if worker_id is None:
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    count = 0
+    success_count = 0
+    while True:
+        task = claim_task(db, worker_id, stale_after, max_attempts, queue_table_name)
+        if task is None:
+            if poll_interval is None:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        logger.info(f"Worker {worker_id} claimed task: {task}")
+        stop_event = threading.Event()
+        heartbeat_thread = threading.Thread(
+            target=_heartbeat_loop,
+            args=(db, task["id"], worker_id, heartbeat_interval, stop_event, queue_table_name),
+            daemon=True,
+        )
+        heartbeat_thread.start()
+        try:
+            max_patents = None
+            if task["shard_end"] is not None:
+                max_patents = task["shard_end"] - task["shard_start"]
+            source = open_source(task["filename"])
+            try:
+                task_count, task_success_count, task_errors = load_from_source(
+                    source,
+                    task["filename"],
+                    push_to_func,
+                    batch_size,
+                    max_patents=max_patents,
+                    keep_log=keep_log,
+                    start_index=task["shard_start"],
+                )
+            finally:
+                source.close()
+            # e.g. the database was down, the task is loaded again later
+            push_errors = get_push_errors(task_errors)
+            if push_errors:
+                raise push_errors[0][2]
+        except Exception as e:
+            logger.error(f"Error: task {task}", exc_info=True)
+            stop_event.set()
+            heartbeat_thread.join()
+            finish_task(
+                db, task["id"], worker_id, error=repr(e),
+                max_attempts=max_attempts, queue_table_name=queue_table_name,
+            )
+            continue
+
+        stop_event.set()
+        heartbeat_thread.join()
+        finish_task(
+            db, task["id"], worker_id,
+            parsed_count=task_success_count,
+            error_count=task_count - task_success_count,
+            queue_table_name=queue_table_name,
+        )
+        count += task_count
+        success_count += task_success_count
+
+    logger.info(f"Worker {worker_id} finished, queue is empty")
+    logger.info(f"Success Count: {success_count}")
+    logger.info(f"Error Count: {count - success_count}")
+    return count, success_count
+
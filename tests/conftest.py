@@ -0,0 +1,15 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def db():
+    """A PGDBInterface to a local Postgres, set with the DATABASE_* env vars."""
+    pytest.importorskip("psycopg2")
+    if "DATABASE_NAME" not in os.environ:
+        pytest.skip("needs a local Postgres, set the DATABASE_* env vars")
+    from parse_uspto_xml.utils.db_interface import PGDBInterface
+    db = PGDBInterface(silent_logging=True)
+    yield db
+    db.close_db_connection()
@@ -0,0 +1,129 @@
+import json
+
+import pytest
+
+from parse_uspto_xml.citation_graph import (
+    CitationGraph,
+    CitationGraphBuilder,
+    _build_csr,
+    normalize_document_number,
+)
+
+
+def reference(document_type, reference=None, country="US", **metadata):
+    return {
+        "reference": reference,
+        "document_type": document_type,
+        "country": country,
+        "kind": None,
+        "metadata": metadata,
+    }
+
+
+PATENTS = [
+    {
+        "publication_number": "US10000001B2",
+        "application_number": "15000001",
+        "referential_documents": [
+            reference("patent-reference", "US9000000B1"),
+            reference("patent-reference", "8000000"),
+            reference("other-reference", "Some journal article", country=None),
+            reference("continuation", application_number="14000000"),
+            reference("priority-claim", "62000000"),
+        ],
+    },
+    {
+        "publication_number": "US9000000B1",
+        "application_number": "14000000",
+        "referential_documents": [
+            reference("patent-reference", "8,000,000"),
+        ],
+    },
+    {
+        "publication_number": "US10000002B2",
+        "application_number": "15000002",
+        "referential_documents": [
+            reference("patent-reference", "US10000001B2"),
+            reference("division", application_number="15000001"),
+        ],
+    },
+]
+
+
+@pytest.mark.parametrize("number, country, expected", [
+    ("US10000000B2", "US", "US10000000"),
+    ("10000000", "US", "US10000000"),
+    ("10,000,000", "US", "US10000000"),
+    ("us 10000000 b2", "US", "US10000000"),
+    ("D0123456S1", "US", "USD123456"),
+    ("RE012345E", "US", "USRE12345"),
+    ("PP12345P3", "US", "USPP12345"),
+    ("EP1234567A1", "US", "EP1234567"),
+    ("1234567", "EP", "EP1234567"),
+])
+def test_normalize_document_number(number, country, expected):
+    assert normalize_document_number(number, country) == expected
+
+
+def test_build_csr():
+    offsets, targets, edge_types = _build_csr(3, [0, 2, 0], [1, 0, 2], [0, 1, 2])
+    assert list(offsets) == [0, 2, 2, 3]
+    assert list(targets) == [1, 2, 0]
+    assert list(edge_types) == [0, 2, 1]
+
+
+@pytest.fixture(params=["patents", "jsonl"])
+def graph_file(request, tmp_path):
+    builder = CitationGraphBuilder()
+    if request.param == "jsonl":
+        jsonl_file = tmp_path / "patents.jsonl"
+        jsonl_file.write_text("".join(json.dumps(patent) + "\n" for patent in PATENTS))
+        builder.add_jsonl(str(jsonl_file))
+    else:
+        builder.add_patents(PATENTS)
+        # patents already added are skipped
+        builder.add_patents(PATENTS[:1])
+    graph_file = str(tmp_path / "citations.graph")
+    builder.save(graph_file)
+    return graph_file
+
+
+def test_citations(graph_file):
+    with CitationGraph(graph_file) as graph:
+        assert sorted(graph.citations("US10000001B2")) == ["US8000000", "US9000000"]
+        assert graph.citations("9000000") == ["US8000000"]
+        assert sorted(graph.cited_by("US8000000")) == ["US10000001", "US9000000"]
+        assert graph.cited_by("US10000001") == ["US10000002"]
+        assert graph.citations("US1") == []
+        assert graph.cited_by("US1") == []
+
+
+def test_family(graph_file):
+    with CitationGraph(graph_file) as graph:
+        # patent references are not part of the family
+        assert graph.family("US10000002B2") == [
+            "APP:US14000000",
+            "APP:US15000001",
+            "APP:US15000002",
+            "APP:US62000000",
+            "US10000001",
+            "US9000000",
+        ]
+        assert "US10000002" in graph.family("APP:US62000000")
+        assert graph.family("US8000000") == []
+
+
+def test_continuation_chain(graph_file):
+    with CitationGraph(graph_file) as graph:
+        assert graph.continuation_chain("US10000002B2") == [
+            "US10000002", "US10000001", "US9000000"
+        ]
+        assert graph.continuation_chain("US9000000") == ["US9000000"]
+        assert graph.continuation_chain("US1") == []
+
+
+def test_not_a_graph_file(tmp_path):
+    not_a_graph = tmp_path / "patents.jsonl"
+    not_a_graph.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        CitationGraph(str(not_a_graph))
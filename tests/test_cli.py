@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from parse_uspto_xml.cli import main
+from parse_uspto_xml.parse_patent import XML_DECLARATION
+
+# fails to parse, it has no publication reference
+DOCUMENT = (
+    f"{XML_DECLARATION}\n<us-patent-grant file=\"US0-20200102.XML\">"
+    "<invention-title>Widget</invention-title></us-patent-grant>\n"
+)
+
+
+@pytest.mark.parametrize("argv", [
+    ["--sink", "jsonl", "--fts"],
+    ["--sink", "jsonl", "--no-referential"],
+    ["--sink", "sqlite", "--array-columns"],
+    ["--sink", "parquet", "--hash-upsert"],
+    ["--sink", "sqlite", "--search-index"],
+    ["--sink", "postgres", "--fields", "abstract"],
+    ["--sink", "jsonl", "--fields", "unknown"],
+    ["--resume", "state.json", "--limit-per-file", "10"],
+    ["--resume", "state.json", "--citation-graph", "citations.graph"],
+    ["--sync", "state.json", "--limit-per-file", "10"],
+    ["--sync", "state.json", "--citation-graph", "citations.graph"],
+])
+def test_conflicting_options_are_rejected(argv):
+    with pytest.raises(SystemExit) as exc_info:
+        main(["ipg200102.xml", *argv])
+    assert exc_info.value.code == 2
+
+
+def test_resume_skips_files_which_failed_to_push(tmp_path):
+    input_dir = tmp_path / "patent"
+    input_dir.mkdir()
+    (input_dir / "ipg200102.xml").write_text(DOCUMENT)
+    state_file = str(tmp_path / "state.json")
+
+    # the output directory does not exist, every push fails
+    main([
+        str(input_dir), "--sink", "jsonl", "--output", str(tmp_path / "missing" / "out.jsonl"),
+        "--resume", state_file, "--log-level", "ERROR",
+    ])
+    # nothing recorded, the state file is not even written
+    assert not (tmp_path / "state.json").exists()
+
+    main([
+        str(input_dir), "--sink", "jsonl", "--output", str(tmp_path / "out.jsonl"),
+        "--resume", state_file, "--log-level", "ERROR",
+    ])
+    with open(state_file) as fp:
+        assert list(json.load(fp)["files"]) == [str(input_dir / "ipg200102.xml")]
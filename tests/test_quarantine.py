@@ -0,0 +1,37 @@
+import pytest
+
+from parse_uspto_xml.parse_patent import XML_DECLARATION, load_batch_from_data
+from parse_uspto_xml.quarantine import QuarantineSink, replay_quarantine
+
+# fails to parse, it has no publication reference
+DOCUMENT = (
+    f"{XML_DECLARATION}\n<us-patent-grant file=\"US0-20200102.XML\">"
+    "<invention-title>Widget &amp; gadget</invention-title></us-patent-grant>\n"
+)
+
+
+@pytest.mark.parametrize("document, unescape, bytes_pipeline", [
+    (DOCUMENT, False, False),
+    (DOCUMENT, True, False),
+    (DOCUMENT.encode("utf-8"), False, True),
+], ids=["text", "unescaped-text", "bytes"])
+def test_documents_are_replayed_as_they_were_loaded(tmp_path, document, unescape, bytes_pipeline):
+    quarantine = QuarantineSink(str(tmp_path))
+    count, success_count, _, _ = load_batch_from_data(
+        [document], unescape=unescape, quarantine=quarantine,
+        source_file="ipg200102.xml", byte_offsets=[0],
+    )
+    assert (count, success_count) == (1, 0)
+
+    [record] = quarantine.records()
+    assert (record["unescape"], record["bytes_pipeline"]) == (unescape, bytes_pipeline)
+    assert quarantine.read_raw_document(record) == DOCUMENT.encode("utf-8")
+
+    pushed = []
+    assert replay_quarantine(quarantine, pushed.extend) == (1, 0)
+    # still failing, quarantined again the same way
+    [replayed_record] = quarantine.records()
+    assert replayed_record["id"] == record["id"]
+    assert replayed_record["attempts"] == 2
+    assert (replayed_record["unescape"], replayed_record["bytes_pipeline"]) == (unescape, bytes_pipeline)
+    assert pushed == []
@@ -0,0 +1,74 @@
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def patent_table_name(db):
+    patent_table_name = f"test_patents_{uuid.uuid4().hex[:8]}"
+    db.obtain_db_cursor().execute(f"""
+        CREATE TABLE {patent_table_name}(
+            publication_number VARCHAR PRIMARY KEY,
+            publication_title VARCHAR,
+            publication_date DATE,
+            application_number VARCHAR,
+            patent_office VARCHAR,
+            abstract TEXT,
+            description TEXT,
+            claims TEXT,
+            updated_at TIMESTAMP without time zone
+        );
+        CREATE UNIQUE INDEX ON {patent_table_name} (application_number, patent_office);
+    """)
+    yield patent_table_name
+    db.obtain_db_cursor().execute(f"""
+        DROP TABLE {patent_table_name}_search;
+        DROP TABLE {patent_table_name};
+        DROP FUNCTION {patent_table_name}_search_pending;
+    """)
+
+
+def upsert_patent(db, patent_table_name, application_number, title, abstract):
+    db.obtain_db_cursor().execute(
+        f"""INSERT INTO {patent_table_name}
+                (publication_number, publication_title, application_number,
+                 patent_office, abstract, updated_at)
+                VALUES (%(application_number)s, %(title)s, %(application_number)s,
+                        'uspto', %(abstract)s, NOW())
+                ON CONFLICT (application_number, patent_office) DO UPDATE
+                SET (publication_title, abstract, updated_at) =
+                    (EXCLUDED.publication_title, EXCLUDED.abstract, EXCLUDED.updated_at)""",
+        {"application_number": application_number, "title": title, "abstract": abstract},
+    )
+
+
+def test_only_new_and_updated_patents_are_indexed(db, patent_table_name):
+    search_table_name = f"{patent_table_name}_search"
+
+    def update_search_index():
+        return db.update_search_index(
+            patent_table_name, search_table_name, batch_size=2
+        )
+
+    def search(query):
+        return [
+            patent["publication_number"] for patent in db.search_patents(
+                query, patent_table_name=patent_table_name,
+                search_table_name=search_table_name,
+            )
+        ]
+
+    upsert_patent(db, patent_table_name, "1", "Neural network accelerator", "")
+    upsert_patent(db, patent_table_name, "2", "Bicycle brake", "")
+    upsert_patent(db, patent_table_name, "3", "Coffee grinder", "")
+    # loaded before the first update, in several batches
+    assert update_search_index() == 3
+    assert update_search_index() == 0
+    assert search("accelerator") == ["1"]
+
+    upsert_patent(db, patent_table_name, "2", "Bicycle brake", "with an accelerator")
+    upsert_patent(db, patent_table_name, "4", "Tea kettle", "")
+    assert update_search_index() == 2
+    assert update_search_index() == 0
+    assert sorted(search("accelerator")) == ["1", "2"]
+    assert search("kettle") == ["4"]
@@ -0,0 +1,33 @@
+import json
+
+from parse_uspto_xml.parse_patent import XML_DECLARATION
+from parse_uspto_xml.sync import sync_local_files
+
+# fails to parse, it has no publication reference
+DOCUMENT = (
+    f"{XML_DECLARATION}\n<us-patent-grant file=\"US0-20200102.XML\">"
+    "<invention-title>Widget</invention-title></us-patent-grant>\n"
+)
+
+
+def test_files_which_failed_to_push_are_synced_again(tmp_path):
+    input_dir = tmp_path / "patent"
+    input_dir.mkdir()
+    (input_dir / "ipg200102.xml").write_text(DOCUMENT)
+    state_file = str(tmp_path / "sync_state.json")
+
+    def failing_push_to_func(patents):
+        raise ConnectionError("database is down")
+
+    sync_local_files([str(input_dir)], failing_push_to_func, state_file=state_file)
+    with open(state_file) as fp:
+        assert json.load(fp)["files"] == {}
+
+    pushed = []
+    sync_local_files([str(input_dir)], pushed.append, state_file=state_file)
+    with open(state_file) as fp:
+        assert list(json.load(fp)["files"]) == [str(input_dir / "ipg200102.xml")]
+    assert pushed == [[]]
+
+    # nothing changed since
+    assert sync_local_files([str(input_dir)], pushed.append, state_file=state_file) == (0, 0, [])
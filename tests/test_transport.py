@@ -0,0 +1,92 @@
+import os
+import zipfile
+
+import pytest
+
+from parse_uspto_xml import transport
+from parse_uspto_xml.parse_patent import XML_DECLARATION, get_filenames_from_dir, load_local_files
+from parse_uspto_xml.scanner import scan_files
+from parse_uspto_xml.transport import MmapSource, SharedMemorySource, open_source
+
+DOCUMENTS = (
+    f"{XML_DECLARATION}\n<us-patent-grant>1</us-patent-grant>\n"
+    f"{XML_DECLARATION}\n<us-patent-grant>2</us-patent-grant>\n"
+).encode("utf-8")
+
+
+def test_empty_file_has_no_documents(tmp_path):
+    empty_file = tmp_path / "ipg200102.xml"
+    empty_file.write_bytes(b"")
+
+    source = open_source(str(empty_file))
+    try:
+        assert source.spans() == []
+    finally:
+        source.close()
+
+    pushed = []
+    assert load_local_files([str(tmp_path)], pushed.append) == (0, 0, [])
+    assert pushed == []
+
+
+def test_extracted_zip_is_skipped(tmp_path):
+    xml_file = tmp_path / "ipg200102.xml"
+    xml_file.write_bytes(b"")
+    with zipfile.ZipFile(tmp_path / "ipg200102.zip", "w") as zip_file:
+        zip_file.writestr("ipg200102.xml", b"")
+    with zipfile.ZipFile(tmp_path / "ipg200109.zip", "w") as zip_file:
+        zip_file.writestr("ipg200109.xml", b"")
+
+    assert [path for path, _ in scan_files(str(tmp_path))] == [
+        str(xml_file), str(tmp_path / "ipg200109.zip")
+    ]
+
+
+def write_zip(tmp_path):
+    zip_filename = str(tmp_path / "ipg200102.zip")
+    with zipfile.ZipFile(zip_filename, "w") as zip_file:
+        zip_file.writestr("ipg200102.xml", DOCUMENTS)
+    return zip_filename
+
+
+def read_documents(source):
+    with source.buffer() as buffer:
+        return [bytes(buffer[offset : offset + length]) for offset, length in source.spans()]
+
+
+def test_zip_is_decompressed_to_a_temporary_file_without_a_pool(tmp_path):
+    source = open_source(write_zip(tmp_path))
+    assert isinstance(source, MmapSource)
+    temp_filename = source.filename
+    try:
+        assert len(read_documents(source)) == 2
+    finally:
+        source.close()
+    assert not os.path.exists(temp_filename)
+
+
+@pytest.mark.skipif(not os.path.isdir(transport.SHARED_MEMORY_DIR), reason="no /dev/shm")
+def test_shared_zip_falls_back_to_a_temporary_file(tmp_path, monkeypatch):
+    zip_filename = write_zip(tmp_path)
+    source = open_source(zip_filename, shared=True)
+    try:
+        assert isinstance(source, SharedMemorySource)
+        documents = read_documents(source)
+    finally:
+        source.close()
+
+    # as if /dev/shm was full
+    monkeypatch.setattr(os, "statvfs", lambda path: os.statvfs_result((0,) * 10))
+    source = open_source(zip_filename, shared=True)
+    try:
+        assert isinstance(source, MmapSource)
+        assert read_documents(source) == documents
+    finally:
+        source.close()
+
+
+def test_get_filenames_from_dir(tmp_path):
+    (tmp_path / "2020").mkdir()
+    (tmp_path / "2020" / "ipg200102.xml").write_bytes(b"")
+    (tmp_path / "README.txt").write_bytes(b"")
+    assert get_filenames_from_dir(str(tmp_path)) == [str(tmp_path / "2020" / "ipg200102.xml")]
@@ -0,0 +1,133 @@
+import uuid
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from parse_uspto_xml import work_queue
+from parse_uspto_xml.parse_patent import XML_DECLARATION
+
+
+@pytest.fixture
+def queue_table_name(db):
+    queue_table_name = f"test_ingest_queue_{uuid.uuid4().hex[:8]}"
+    work_queue.create_queue_table(db, queue_table_name)
+    yield queue_table_name
+    db.obtain_db_cursor().execute(f"DROP TABLE {queue_table_name}")
+
+
+def write_bulk_file(path, n_documents=1):
+    # documents which fail to parse, the pushed batches are empty
+    document = (
+        f"{XML_DECLARATION}\n<us-patent-grant file=\"US0-20200102.XML\">"
+        "<invention-title>Widget</invention-title></us-patent-grant>\n"
+    )
+    path.write_text(document * n_documents)
+    return str(path)
+
+
+def make_stale(db, queue_table_name, task_id):
+    db.obtain_db_cursor().execute(
+        f"""UPDATE {queue_table_name}
+                SET heartbeat_at = NOW() - INTERVAL '1 hour' WHERE id = %s""",
+        (task_id,),
+    )
+
+
+def get_task_row(db, queue_table_name, task_id):
+    db_cursor = db.obtain_db_cursor()
+    db_cursor.execute(
+        f"""SELECT status, attempts, worker_id, parsed_count, error_count, last_error
+                FROM {queue_table_name} WHERE id = %s""",
+        (task_id,),
+    )
+    return dict(zip(
+        ["status", "attempts", "worker_id", "parsed_count", "error_count", "last_error"],
+        db_cursor.fetchone(),
+    ))
+
+
+def test_tasks_are_claimed_once_largest_first(db, queue_table_name, tmp_path):
+    small_file = write_bulk_file(tmp_path / "ipg200102.xml", n_documents=1)
+    large_file = write_bulk_file(tmp_path / "ipg200109.xml", n_documents=3)
+    assert work_queue.enqueue_files(db, str(tmp_path), queue_table_name=queue_table_name) == 2
+    # already queued files are left untouched
+    assert work_queue.enqueue_files(db, str(tmp_path), queue_table_name=queue_table_name) == 0
+
+    first_task = work_queue.claim_task(db, "worker-1", queue_table_name=queue_table_name)
+    second_task = work_queue.claim_task(db, "worker-2", queue_table_name=queue_table_name)
+    assert first_task["filename"] == large_file
+    assert second_task["filename"] == small_file
+    assert first_task["attempts"] == second_task["attempts"] == 1
+    assert work_queue.claim_task(db, "worker-3", queue_table_name=queue_table_name) is None
+
+
+def test_stale_task_is_claimed_again(db, queue_table_name, tmp_path):
+    write_bulk_file(tmp_path / "ipg200102.xml")
+    work_queue.enqueue_files(db, str(tmp_path), queue_table_name=queue_table_name)
+
+    task = work_queue.claim_task(db, "worker-1", max_attempts=2, queue_table_name=queue_table_name)
+    # still sending heartbeats
+    assert work_queue.claim_task(db, "worker-2", max_attempts=2, queue_table_name=queue_table_name) is None
+
+    make_stale(db, queue_table_name, task["id"])
+    reclaimed_task = work_queue.claim_task(db, "worker-2", max_attempts=2, queue_table_name=queue_table_name)
+    assert reclaimed_task["id"] == task["id"]
+    assert reclaimed_task["attempts"] == 2
+    # the claim was lost to worker-2
+    assert not work_queue.heartbeat(db, task["id"], "worker-1", queue_table_name=queue_table_name)
+    assert work_queue.heartbeat(db, task["id"], "worker-2", queue_table_name=queue_table_name)
+
+    make_stale(db, queue_table_name, task["id"])
+    assert work_queue.claim_task(db, "worker-3", max_attempts=2, queue_table_name=queue_table_name) is None
+    assert get_task_row(db, queue_table_name, task["id"])["status"] == "failed"
+
+
+def test_finish_task(db, queue_table_name, tmp_path):
+    write_bulk_file(tmp_path / "ipg200102.xml")
+    write_bulk_file(tmp_path / "ipg200109.xml")
+    work_queue.enqueue_files(db, str(tmp_path), queue_table_name=queue_table_name)
+
+    task = work_queue.claim_task(db, "worker-1", queue_table_name=queue_table_name)
+    work_queue.finish_task(
+        db, task["id"], "worker-1", parsed_count=2, error_count=1,
+        queue_table_name=queue_table_name,
+    )
+    row = get_task_row(db, queue_table_name, task["id"])
+    assert (row["status"], row["parsed_count"], row["error_count"]) == ("done", 2, 1)
+
+    # an error returns the task to the queue until it used up its attempts
+    task = work_queue.claim_task(db, "worker-1", max_attempts=2, queue_table_name=queue_table_name)
+    work_queue.finish_task(
+        db, task["id"], "worker-1", error="ConnectionError()", max_attempts=2,
+        queue_table_name=queue_table_name,
+    )
+    row = get_task_row(db, queue_table_name, task["id"])
+    assert (row["status"], row["last_error"]) == ("pending", "ConnectionError()")
+
+    task = work_queue.claim_task(db, "worker-2", max_attempts=2, queue_table_name=queue_table_name)
+    assert task["attempts"] == 2
+    work_queue.finish_task(
+        db, task["id"], "worker-2", error="ConnectionError()", max_attempts=2,
+        queue_table_name=queue_table_name,
+    )
+    assert get_task_row(db, queue_table_name, task["id"])["status"] == "failed"
+
+
+def test_failed_push_returns_task_to_queue(db, queue_table_name, tmp_path):
+    write_bulk_file(tmp_path / "ipg200102.xml")
+    work_queue.enqueue_files(db, str(tmp_path), queue_table_name=queue_table_name)
+
+    def push_to_func(patents):
+        raise ConnectionError("database is down")
+
+    work_queue.run_worker(
+        db, push_to_func, worker_id="worker-1", max_attempts=2,
+        queue_table_name=queue_table_name,
+    )
+    db_cursor = db.obtain_db_cursor()
+    db_cursor.execute(f"SELECT status, attempts, last_error FROM {queue_table_name}")
+    status, attempts, last_error = db_cursor.fetchone()
+    # claimed again by the same worker, until it used up its attempts
+    assert (status, attempts) == ("failed", 2)
+    assert "database is down" in last_error